@@ -1,10 +1,32 @@
 from django.contrib import admin
+from django.urls import reverse
+from django.utils.html import format_html
 from import_export.admin import ImportExportModelAdmin
 from import_export import resources, fields
 from simple_history.admin import SimpleHistoryAdmin
 
-from .models import Album, Photo, Collage, BugReport
-from .utils import export_queryset_to_excel
+from .exports import EXPORT_REPORTS, request_export
+from .models import Album, Photo, Collage, CollageJob, ExportJob, UploadSession, BugReport
+from .utils import annotate_album_totals, export_queryset
+
+
+def queue_background_export(modeladmin, request, kind, queryset):
+    """
+    Ставит экспорт выбранных записей в очередь фонового воркера вместо сборки
+    файла в запросе; ссылка на статус (и затем на файл) — в сообщении админки.
+    """
+    ids = sorted(str(pk) for pk in queryset.values_list("pk", flat=True))
+    job, created = request_export(request.user, kind, "xlsx", {"ids": ids})
+    status_url = reverse("exportjob-detail", kwargs={"pk": job.pk})
+    modeladmin.message_user(
+        request,
+        format_html(
+            '{} Статус и ссылка на файл: <a href="{}">{}</a>',
+            "Экспорт поставлен в очередь." if created else "Такой экспорт уже есть.",
+            status_url,
+            status_url,
+        ),
+    )
 
 
 class AlbumResource(resources.ModelResource):
@@ -21,7 +43,8 @@ class AlbumResource(resources.ModelResource):
 
     # Customization 2: Get specific field (Calculate value)
     def dehydrate_photo_count(self, album):
-        return album.photos.count()
+        # Подсчитано подзапросом в get_export_queryset, без запроса на каждую строку
+        return album.photo_count
 
     # Customization 3: Filter Queryset for Export (e.g., exclude empty albums or sort)
     def get_export_queryset(self, request, queryset):
@@ -30,8 +53,13 @@ class AlbumResource(resources.ModelResource):
         Only export albums that are either public or belong to the current user (if user is not superuser).
         Superusers get everything selected.
         Example customization: Ordered by reversed creation date.
+        Photo counts are annotated and the owner is joined in the same SELECT.
         """
-        return queryset.order_by("-created_at")
+        return annotate_album_totals(queryset.select_related("user")).order_by("-created_at")
+
+    def filter_export(self, queryset, **kwargs):
+        # import-export вызывает у ресурса filter_export, а не get_export_queryset
+        return self.get_export_queryset(kwargs.get("request"), queryset)
 
 
 class PhotoInline(admin.TabularInline):
@@ -53,6 +81,7 @@ class AlbumAdmin(ImportExportModelAdmin, SimpleHistoryAdmin):
     readonly_fields = ("created_at", "updated_at")
     raw_id_fields = ("user",)
     filter_horizontal = ("editors",)
+    actions = ["export_in_background"]
 
     fieldsets = (
         ("Основные", {
@@ -71,38 +100,49 @@ class AlbumAdmin(ImportExportModelAdmin, SimpleHistoryAdmin):
     def photo_count(self, obj):
         return obj.photos.count()
 
+    @admin.action(description="Экспорт выбранных альбомов в Excel (в фоне)")
+    def export_in_background(self, request, queryset):
+        queue_background_export(self, request, "admin_albums", queryset)
+
 
 @admin.register(BugReport)
 class BugReportAdmin(ImportExportModelAdmin):
-    list_display = ("title", "user", "status", "created_at")
-    list_filter = ("status", "created_at")
+    list_display = ("title", "user", "status", "occurrences", "last_seen_at", "created_at")
+    list_filter = ("status", "created_at", "last_seen_at")
     search_fields = ("title", "description", "user__username")
     date_hierarchy = "created_at"
-    readonly_fields = ("created_at",)
+    # Повторы ошибки сгруппированы в один отчёт: сверху — недавно повторявшиеся
+    ordering = ("-last_seen_at",)
+    readonly_fields = ("created_at", "fingerprint", "occurrences", "last_seen_at")
     raw_id_fields = ("user",)
     # Keeping the custom action as well
-    actions = ["export_to_excel"]
+    actions = ["export_to_excel", "export_to_csv", "export_to_ndjson", "export_in_background"]
 
     @admin.action(description="Экспорт выбранных баг-репортов в Excel (Custom)")
     def export_to_excel(self, request, queryset):
-        headers = ["ID", "User", "Title", "Description", "Status", "Created At"]
-
-        def extract_row(report):
-            return [
-                report.id,
-                report.user.username if report.user else "Anonymous",
-                report.title,
-                report.description,
-                report.status,
-                report.created_at.strftime("%Y-%m-%d %H:%M:%S"),
-            ]
-
-        return export_queryset_to_excel(
-            queryset=queryset,
-            headers=headers,
-            row_extractor=extract_row,
-            sheet_title="Bug Reports",
-            filename_prefix="bug_reports",
+        return self.export_reports(queryset, "xlsx")
+
+    @admin.action(description="Экспорт выбранных баг-репортов в CSV (потоково)")
+    def export_to_csv(self, request, queryset):
+        return self.export_reports(queryset, "csv")
+
+    @admin.action(description="Экспорт выбранных баг-репортов в NDJSON (потоково)")
+    def export_to_ndjson(self, request, queryset):
+        return self.export_reports(queryset, "ndjson")
+
+    @admin.action(description="Экспорт выбранных баг-репортов в Excel (в фоне)")
+    def export_in_background(self, request, queryset):
+        queue_background_export(self, request, "bug_reports", queryset)
+
+    def export_reports(self, queryset, export_format):
+        report = EXPORT_REPORTS["bug_reports"]
+        return export_queryset(
+            queryset=queryset.select_related("user"),
+            headers=report.headers,
+            row_extractor=report.row,
+            sheet_title=report.sheet_title,
+            filename_prefix=report.filename_prefix,
+            export_format=export_format,
         )
 
 
@@ -116,3 +156,28 @@ class PhotoAdmin(SimpleHistoryAdmin):
 
 
 admin.site.register(Collage)
+
+
+@admin.register(CollageJob)
+class CollageJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "album", "status", "created_at", "finished_at")
+    list_filter = ("status", "created_at")
+    raw_id_fields = ("album", "user", "collage")
+    readonly_fields = ("created_at", "started_at", "finished_at")
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "user", "kind", "export_format", "status", "created_at", "expires_at")
+    list_filter = ("status", "kind", "export_format", "created_at")
+    raw_id_fields = ("user",)
+    readonly_fields = ("fingerprint", "created_at", "started_at", "finished_at")
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ("id", "album", "filename", "status", "received_bytes", "total_size", "updated_at")
+    list_filter = ("status", "created_at")
+    search_fields = ("filename", "idempotency_key")
+    raw_id_fields = ("album", "user", "photo")
+    readonly_fields = ("created_at", "updated_at")
@@ -0,0 +1,326 @@
+"""
+Автоматические отчёты об ошибках.
+
+Исключения группируются по отпечатку: полное имя типа исключения плюс
+нормализованный стек (файлы относительно проекта или site-packages и имена
+функций, без номеров строк и текста сообщения, в котором бывают id и адреса).
+Повтор ошибки с открытым отчётом — один UPDATE счётчика occurrences и
+last_seen_at; новый отчёт создаётся только для новой ошибки или после
+закрытия старого (уникальность открытого отчёта по отпечатку — в БД).
+
+Middleware не пишет в БД сам: он кладёт лёгкое событие (стек без исходных
+строк и локальных переменных) в ограниченную очередь BugReportWriter, а
+фоновый поток пачками записывает их, сворачивая повторы одной ошибки в один
+UPDATE. Если очередь полна, событие отбрасывается и учитывается в dropped —
+во время инцидента важнее не нагружать БД, чем сохранить каждый повтор.
+При завершении процесса очередь дописывается (atexit).
+"""
+
+import atexit
+import functools
+import hashlib
+import os
+import queue
+import site
+import sys
+import sysconfig
+import threading
+import traceback
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import BugReport
+
+BUG_REPORT_QUEUE_SIZE = 1000
+BUG_REPORT_BATCH_SIZE = 100
+BUG_REPORT_FLUSH_INTERVAL = 1.0
+
+
+@functools.lru_cache(maxsize=1)
+def _path_prefixes() -> Tuple[str, ...]:
+    prefixes = [str(settings.BASE_DIR)]
+    prefixes += [sysconfig.get_paths()[key] for key in ("purelib", "platlib", "stdlib")]
+    prefixes += site.getsitepackages() if hasattr(site, "getsitepackages") else []
+    # Сначала более длинные: site-packages лежит внутри stdlib-каталога venv
+    return tuple(sorted({os.path.normpath(p) for p in prefixes}, key=len, reverse=True))
+
+
+def normalize_frame_path(filename: str) -> str:
+    """Путь файла без машинно-зависимой части (каталога проекта или интерпретатора)."""
+    path = os.path.normpath(filename)
+    for prefix in _path_prefixes():
+        if path.startswith(prefix + os.sep):
+            path = path[len(prefix) + 1 :]
+            break
+    return path.replace(os.sep, "/")
+
+
+def stack_fingerprint(exc_type: type, frames: Iterable[Any]) -> str:
+    """Отпечаток по типу исключения и кадрам (filename, name) без номеров строк."""
+    parts = [f"{exc_type.__module__}.{exc_type.__qualname__}"]
+    parts += [f"{normalize_frame_path(frame.filename)}:{frame.name}" for frame in frames]
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+def exception_fingerprint(exception: BaseException) -> str:
+    """Отпечаток ошибки: тип исключения и стек вызовов без номеров строк."""
+    frames = traceback.StackSummary.extract(
+        traceback.walk_tb(exception.__traceback__), lookup_lines=False
+    )
+    return stack_fingerprint(type(exception), frames)
+
+
+def record_bug_report(
+    fingerprint: str,
+    title: str,
+    description: str,
+    user_id: Optional[int] = None,
+    seen_at: Optional[Any] = None,
+    occurrences: int = 1,
+) -> None:
+    """
+    Учитывает occurrences появлений ошибки: увеличивает счётчик открытого
+    отчёта с тем же отпечатком или создаёт новый отчёт.
+    """
+    seen_at = seen_at or timezone.now()
+    repeat = BugReport.objects.filter(fingerprint=fingerprint, status="open")
+    if repeat.update(occurrences=F("occurrences") + occurrences, last_seen_at=seen_at):
+        return
+    try:
+        with transaction.atomic():
+            BugReport.objects.create(
+                user_id=user_id,
+                title=title,
+                description=description,
+                status="open",
+                fingerprint=fingerprint,
+                occurrences=occurrences,
+                last_seen_at=seen_at,
+            )
+    except IntegrityError:
+        # Параллельный запрос успел создать отчёт с этим отпечатком
+        repeat.update(occurrences=F("occurrences") + occurrences, last_seen_at=seen_at)
+
+
+@dataclass
+class BugReportEvent:
+    """
+    Одно необработанное исключение, снятое на пути ошибки.
+
+    Хранится только то, что дёшево получить сразу: кадры стека без исходных
+    строк (их подставит linecache при форматировании) и без ссылок на фреймы,
+    поэтому событие в очереди не удерживает локальные переменные запроса.
+    """
+
+    exc_type: type
+    message: str
+    exception_only: str
+    frames: traceback.StackSummary
+    path: str
+    method: str
+    user_id: Optional[int]
+    username: str
+    seen_at: Any
+
+    @classmethod
+    def capture(cls, request: Any, exception: BaseException, user: Any = None) -> "BugReportEvent":
+        return cls(
+            exc_type=type(exception),
+            message=str(exception),
+            exception_only="".join(traceback.format_exception_only(type(exception), exception)),
+            frames=traceback.StackSummary.extract(
+                traceback.walk_tb(exception.__traceback__), lookup_lines=False
+            ),
+            path=request.path,
+            method=request.method,
+            user_id=user.pk if user is not None else None,
+            username=str(user) if user is not None else "",
+            seen_at=timezone.now(),
+        )
+
+    @property
+    def fingerprint(self) -> str:
+        return stack_fingerprint(self.exc_type, self.frames)
+
+    @property
+    def title(self) -> str:
+        title = f"Auto-Report: {self.exc_type.__name__}: {self.message}"
+        if len(title) > 255:
+            title = title[:252] + "..."
+        return title
+
+    @property
+    def description(self) -> str:
+        user_info = (
+            f"User: {self.username} (ID: {self.user_id})"
+            if self.user_id is not None
+            else "User: Anonymous"
+        )
+        tb_string = (
+            "Traceback (most recent call last):\n"
+            + "".join(self.frames.format())
+            + self.exception_only
+        )
+        return (
+            f"Path: {self.path}\n"
+            f"Method: {self.method}\n"
+            f"{user_info}\n\n"
+            f"Traceback:\n"
+            f"{tb_string}"
+        )
+
+
+class BugReportWriter:
+    """
+    Ограниченная очередь событий и фоновый поток, записывающий их пачками.
+
+    submit() не блокируется и не обращается к БД. С background=False поток не
+    запускается и события записываются только при flush() — так в тестах
+    запись идёт в соединении и транзакции теста.
+    """
+
+    def __init__(
+        self,
+        max_size: int = BUG_REPORT_QUEUE_SIZE,
+        batch_size: int = BUG_REPORT_BATCH_SIZE,
+        flush_interval: float = BUG_REPORT_FLUSH_INTERVAL,
+        background: bool = True,
+    ):
+        self.queue: "queue.Queue[BugReportEvent]" = queue.Queue(maxsize=max_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.background = background
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._stop = threading.Event()
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self._reported_dropped = 0
+        atexit.register(self.stop)
+
+    def submit(self, event: BugReportEvent) -> bool:
+        """Ставит событие в очередь; False — очередь полна и событие отброшено."""
+        if self.background:
+            self._ensure_thread()
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        """Счётчики записанных, отброшенных и не записанных из-за ошибки событий."""
+        with self._lock:
+            return {
+                "queued": self.queue.qsize(),
+                "written": self.written,
+                "dropped": self.dropped,
+                "failed": self.failed,
+            }
+
+    def flush(self) -> int:
+        """Синхронно записывает всё, что сейчас в очереди; возвращает число событий."""
+        flushed = 0
+        while True:
+            batch = self._take_batch(block=False)
+            if not batch:
+                return flushed
+            self._write(batch)
+            flushed += len(batch)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Останавливает поток и дописывает остаток очереди (вызывается при выходе)."""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout)
+        self.flush()
+
+    def _ensure_thread(self) -> None:
+        # После fork (gunicorn) потока родителя в дочернем процессе нет
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._stop.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name="bug-report-writer", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        try:
+            while not self._stop.is_set():
+                batch = self._take_batch(block=True)
+                if batch:
+                    # Долгоживущий поток: не пишем через оборванное или устаревшее соединение
+                    close_old_connections()
+                    self._write(batch)
+        finally:
+            connection.close()
+
+    def _take_batch(self, block: bool) -> List[BugReportEvent]:
+        try:
+            first = self.queue.get(timeout=self.flush_interval) if block else self.queue.get_nowait()
+        except queue.Empty:
+            return []
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: List[BugReportEvent]) -> None:
+        # Повторы одной ошибки в пачке — один UPDATE (или INSERT) на отпечаток
+        groups: Dict[str, List[BugReportEvent]] = {}
+        for event in batch:
+            groups.setdefault(event.fingerprint, []).append(event)
+
+        for fingerprint, events in groups.items():
+            first = events[0]
+            try:
+                record_bug_report(
+                    fingerprint,
+                    title=first.title,
+                    description=first.description,
+                    user_id=first.user_id,
+                    seen_at=max(event.seen_at for event in events),
+                    occurrences=len(events),
+                )
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                with self._lock:
+                    self.failed += len(events)
+                print(f"Failed to write automatic bug report: {e}", file=sys.stderr)
+            else:
+                with self._lock:
+                    self.written += len(events)
+
+        with self._lock:
+            dropped = self.dropped - self._reported_dropped
+            self._reported_dropped = self.dropped
+        if dropped:
+            print(f"Dropped {dropped} automatic bug report(s): queue is full", file=sys.stderr)
+
+
+@functools.lru_cache(maxsize=1)
+def get_bug_report_writer() -> BugReportWriter:
+    """Общий для процесса BugReportWriter с параметрами из настроек."""
+    return BugReportWriter(
+        max_size=getattr(settings, "BUG_REPORT_QUEUE_SIZE", BUG_REPORT_QUEUE_SIZE),
+        batch_size=getattr(settings, "BUG_REPORT_BATCH_SIZE", BUG_REPORT_BATCH_SIZE),
+        flush_interval=getattr(settings, "BUG_REPORT_FLUSH_INTERVAL", BUG_REPORT_FLUSH_INTERVAL),
+        background=getattr(settings, "BUG_REPORT_BACKGROUND", True),
+    )
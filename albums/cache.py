@@ -0,0 +1,121 @@
+"""
+Локальный дисковый кэш с вытеснением по LRU.
+
+Записи пишутся во временный файл и атомарно переименовываются (os.replace),
+поэтому несколько воркеров могут пользоваться одной директорией без блокировок:
+читатель видит либо старую, либо новую запись целиком. Время последнего
+обращения хранится в mtime файла, по нему же выбираются записи на вытеснение.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from typing import Iterable, List, Optional, Tuple
+
+
+class DiskLRUCache:
+    """Кэш байтов на локальном диске, ограниченный по суммарному размеру."""
+
+    # После вытеснения кэш занимает не больше этой доли лимита,
+    # чтобы не сканировать директорию на каждой записи
+    LOW_WATERMARK = 0.9
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._approx_size: Optional[int] = None
+
+    def _path(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def get_path(self, key: str) -> Optional[str]:
+        """Возвращает путь к файлу записи или None при промахе."""
+        path = self._path(key)
+        try:
+            # Обновляем mtime: запись становится самой свежей для LRU
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self.get_path(key)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            # Запись вытеснил другой процесс между utime и open
+            return None
+
+    def set(self, key: str, data: bytes) -> str:
+        """Атомарно сохраняет запись и возвращает путь к ней."""
+        return self.set_chunks(key, [data])
+
+    def set_chunks(self, key: str, chunks: Iterable[bytes]) -> str:
+        """Как set(), но данные пишутся по частям и целиком в памяти не держатся."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        written = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    written += len(chunk)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+        self._track(written)
+        return path
+
+    def delete(self, key: str) -> None:
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _track(self, added: int) -> None:
+        with self._lock:
+            if self._approx_size is None:
+                self._approx_size = sum(size for _, size, _ in self._entries())
+            else:
+                self._approx_size += added
+            if self._approx_size > self.max_bytes:
+                self._approx_size = self._evict()
+
+    def _evict(self) -> int:
+        """Удаляет самые давние записи, пока кэш не станет меньше нижней границы."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * self.LOW_WATERMARK)
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        return total
@@ -0,0 +1,315 @@
+"""
+Отчёты для экспорта и отложенные задачи экспорта.
+
+Каждый отчёт (EXPORT_REPORTS) описывает QuerySet, заголовки и извлечение
+строки; одно и то же описание используется и для ответа прямо в запросе
+(utils.export_queryset), и для фоновой задачи ExportJob.
+
+Отложенный экспорт: запрос создаёт ExportJob, воркер (manage.py run_worker)
+пишет файл во временный файл и сохраняет его в хранилище exports, клиент
+опрашивает статус и скачивает файл. Повтор того же экспорта того же
+пользователя до истечения EXPORT_JOB_TTL возвращает уже существующую задачу.
+Просроченные файлы удаляет cleanup_export_jobs.
+"""
+
+import hashlib
+import json
+import tempfile
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.files import File
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+
+from .models import Album, BugReport, ExportJob
+from .utils import (
+    XLSX_CONTENT_TYPE,
+    annotate_album_totals,
+    export_filename,
+    format_file_size,
+    write_export_file,
+)
+
+EXPORT_JOB_TTL = 60 * 60
+EXPORT_CONTENT_TYPES = {
+    "xlsx": XLSX_CONTENT_TYPE,
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+@dataclass
+class ExportReport:
+    """Описание отчёта: откуда брать строки и как их записывать."""
+
+    headers: List[str]
+    row: Callable[[Any], List[Any]]
+    sheet_title: str
+    filename_prefix: str
+    # (пользователь, параметры задачи) -> QuerySet со всем, что нужно row
+    queryset: Callable[[Any, Dict[str, Any]], QuerySet]
+
+
+# ==================== Альбомы пользователя (Section 6, 7) ====================
+
+
+def dehydrate_completion_status(album: Any) -> str:
+    # Section 7.2
+    if album.photo_count == 0:
+        return "Пустой"
+    elif album.photo_count < 10:
+        return "Мало фото"
+    return "Заполнен"
+
+
+def dehydrate_template_type(album: Any) -> str:
+    # Section 7.3
+    # Assuming layout_template exists or mocking it
+    layout = getattr(album, "layout_template", "standard")
+    colors = {"wedding": "💒", "travel": "✈️", "portrait": "👤", "family": "👪"}
+    return f"{colors.get(layout, '📁')} {layout}"
+
+
+def dehydrate_album_rating(album: Any) -> str:
+    # Section 7.4
+    views = getattr(album, "views_count", 0)
+    if views > 1000:
+        return "Популярный"
+    elif views > 100:
+        return "Средний"
+    return "Новый"
+
+
+def dehydrate_recent_activity(album: Any) -> str:
+    # Section 7.5
+    if not album.updated_at:
+        return "Неактивный"
+    days_ago = (timezone.now() - album.updated_at).days
+    if days_ago == 0:
+        return "Сегодня"
+    elif days_ago <= 7:
+        return f"{days_ago} дней назад"
+    return "Неактивный"
+
+
+def album_row(album: Any) -> List[Any]:
+    return [
+        album.title,
+        str(album.photo_count),
+        album.created_at.strftime("%Y-%m-%d"),
+        "Standard",  # Mock template
+        "Draft",  # Mock status
+        # Section 7.1: сумма размеров файлов, посчитанная в БД
+        format_file_size(album.total_size),
+        dehydrate_completion_status(album),
+        dehydrate_template_type(album),
+        dehydrate_album_rating(album),
+        dehydrate_recent_activity(album),
+    ]
+
+
+def user_albums(user: Any, params: Dict[str, Any]) -> QuerySet:
+    # Счётчик и размер считаются подзапросами в одном SELECT
+    return annotate_album_totals(Album.objects.filter(user=user))
+
+
+# ==================== Все альбомы (админка) ====================
+
+
+def admin_album_row(album: Any) -> List[Any]:
+    return [
+        str(album.id),
+        album.title,
+        album.user.username,
+        album.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+        "Public" if album.is_public else "Private",
+        album.photo_count,
+    ]
+
+
+def selected_albums(user: Any, params: Dict[str, Any]) -> QuerySet:
+    queryset = annotate_album_totals(Album.objects.select_related("user"))
+    if params.get("ids"):
+        queryset = queryset.filter(pk__in=params["ids"])
+    return queryset.order_by("-created_at")
+
+
+# ==================== Баг-репорты ====================
+
+
+def bug_report_row(report: Any) -> List[Any]:
+    return [
+        report.id,
+        report.user.username if report.user else "Anonymous",
+        report.title,
+        report.description,
+        report.status,
+        report.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+        report.occurrences,
+        report.last_seen_at.strftime("%Y-%m-%d %H:%M:%S"),
+    ]
+
+
+def selected_bug_reports(user: Any, params: Dict[str, Any]) -> QuerySet:
+    queryset = BugReport.objects.select_related("user")
+    if params.get("ids"):
+        queryset = queryset.filter(pk__in=params["ids"])
+    return queryset
+
+
+EXPORT_REPORTS: Dict[str, ExportReport] = {
+    "albums": ExportReport(
+        headers=[
+            "Название",
+            "Кол-во фото",
+            "Дата создания",
+            "Шаблон",
+            "Статус",
+            "Размер",
+            "Заполненность",
+            "Тип",
+            "Рейтинг",
+            "Активность",
+        ],
+        row=album_row,
+        sheet_title="Albums Export",
+        filename_prefix="my_albums",
+        queryset=user_albums,
+    ),
+    "admin_albums": ExportReport(
+        headers=["ID", "Title", "User", "Created At", "Is Public", "Photo Count"],
+        row=admin_album_row,
+        sheet_title="Albums",
+        filename_prefix="albums",
+        queryset=selected_albums,
+    ),
+    "bug_reports": ExportReport(
+        headers=[
+            "ID",
+            "User",
+            "Title",
+            "Description",
+            "Status",
+            "Created At",
+            "Occurrences",
+            "Last Seen",
+        ],
+        row=bug_report_row,
+        sheet_title="Bug Reports",
+        filename_prefix="bug_reports",
+        queryset=selected_bug_reports,
+    ),
+}
+
+
+# ==================== Отложенный экспорт ====================
+
+
+def export_fingerprint(kind: str, export_format: str, params: Dict[str, Any]) -> str:
+    """Отпечаток запроса экспорта: одинаковые запросы дают одинаковый отпечаток."""
+    payload = json.dumps([kind, export_format, params], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def request_export(
+    user: Any, kind: str, export_format: str, params: Optional[Dict[str, Any]] = None
+) -> Tuple[ExportJob, bool]:
+    """
+    Ставит экспорт в очередь и возвращает (задача, создана ли новая).
+
+    Если такой же экспорт этого пользователя ещё в очереди, выполняется или
+    готов и не просрочен, возвращается существующая задача.
+    """
+    if kind not in EXPORT_REPORTS:
+        raise ValueError(f"Unknown export: {kind}")
+    params = params or {}
+    fingerprint = export_fingerprint(kind, export_format, params)
+    reusable = (
+        ExportJob.objects.filter(user=user, fingerprint=fingerprint)
+        .filter(
+            Q(status__in=[ExportJob.STATUS_QUEUED, ExportJob.STATUS_RUNNING])
+            | Q(status=ExportJob.STATUS_DONE, expires_at__gt=timezone.now())
+        )
+        .order_by("-created_at")
+        .first()
+    )
+    if reusable is not None:
+        return reusable, False
+    job = ExportJob.objects.create(
+        user=user, kind=kind, export_format=export_format, params=params, fingerprint=fingerprint
+    )
+    return job, True
+
+
+def export_download_name(job: ExportJob) -> str:
+    """Имя скачиваемого файла (в хранилище оно может быть без расширения)."""
+    prefix = EXPORT_REPORTS[job.kind].filename_prefix
+    return f"{prefix}_{job.created_at.strftime('%Y%m%d')}.{job.export_format}"
+
+
+def claim_next_export_job() -> Optional[ExportJob]:
+    """Забирает самую старую задачу экспорта из очереди и переводит её в running."""
+    queued = ExportJob.objects.filter(status=ExportJob.STATUS_QUEUED).order_by("created_at")
+    for job_id in queued.values_list("id", flat=True)[:10]:
+        claimed = ExportJob.objects.filter(pk=job_id, status=ExportJob.STATUS_QUEUED).update(
+            status=ExportJob.STATUS_RUNNING, started_at=timezone.now()
+        )
+        if claimed:
+            return ExportJob.objects.select_related("user").get(pk=job_id)
+    return None
+
+
+def run_export_job(job: ExportJob) -> ExportJob:
+    """Собирает файл экспорта и сохраняет его в хранилище или текст ошибки."""
+    try:
+        report = EXPORT_REPORTS[job.kind]
+        queryset = report.queryset(job.user, job.params)
+        # Файл пишется на диск построчно и уходит в хранилище одним запросом
+        with tempfile.TemporaryFile() as output:
+            write_export_file(
+                output, queryset, report.headers, report.row, report.sheet_title, job.export_format
+            )
+            job.file_size = output.tell()
+            output.seek(0)
+            job.file.save(
+                export_filename(report.filename_prefix, job.export_format), File(output), save=False
+            )
+        ttl = getattr(settings, "EXPORT_JOB_TTL", EXPORT_JOB_TTL)
+        job.expires_at = timezone.now() + timedelta(seconds=ttl)
+        job.status = ExportJob.STATUS_DONE
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        job.status = ExportJob.STATUS_FAILED
+        job.error = str(e)
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=["file", "file_size", "status", "error", "finished_at", "expires_at"])
+    return job
+
+
+def process_pending_export_jobs() -> int:
+    """Выполняет все задачи экспорта из очереди и возвращает их количество."""
+    processed = 0
+    while True:
+        job = claim_next_export_job()
+        if job is None:
+            return processed
+        run_export_job(job)
+        processed += 1
+
+
+def cleanup_export_jobs(now: Optional[Any] = None) -> int:
+    """
+    Удаляет просроченные экспорты и ошибки старше EXPORT_JOB_TTL.
+    Файлы удаляет сигнал post_delete (albums.signals).
+    """
+    now = now or timezone.now()
+    ttl = getattr(settings, "EXPORT_JOB_TTL", EXPORT_JOB_TTL)
+    expired = ExportJob.objects.filter(
+        Q(status=ExportJob.STATUS_DONE, expires_at__lt=now)
+        | Q(status=ExportJob.STATUS_FAILED, finished_at__lt=now - timedelta(seconds=ttl))
+    )
+    deleted, _ = expired.delete()
+    return deleted
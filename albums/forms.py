@@ -18,7 +18,7 @@ class UserForm(forms.ModelForm):
 class ProfileForm(forms.ModelForm):
     class Meta:
         model = UserProfile
-        fields = ('avatar', 'bio', 'location', 'birth_date')
+        fields = ('avatar', 'bio', 'location', 'birth_date', 'keep_original_photos')
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -0,0 +1,313 @@
+"""
+Общий конвейер загрузки фотографий в альбом.
+
+Все точки входа (API upload-photos, создание альбома и добавление фото
+через веб-интерфейс) проходят одни и те же этапы:
+
+1. проверка всех файлов (размер, сигнатура и заголовок изображения)
+   до любых обращений к хранилищу;
+2. необязательное уменьшение и пережатие исходников (PHOTO_INGEST_MAX_EDGE),
+   если владелец альбома не включил хранение оригиналов; затем метаданные
+   и поиск уже сохранённых копий (один запрос на весь пакет);
+3. миниатюры и отправка файлов в хранилище в ограниченном пуле потоков;
+4. вставка записей Photo и их истории пакетно, в одной транзакции.
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from PIL import Image
+from simple_history.utils import bulk_create_with_history
+
+from .models import Photo, UserProfile
+from .utils import (
+    IMAGE_MAX_PIXELS,
+    PHOTO_FILE_FIELDS,
+    PHOTO_INGEST_MAX_EDGE,
+    build_photo_thumbnails,
+    clear_collage_cache,
+    copy_photo_files,
+    extract_image_metadata,
+    reencode_photo,
+)
+
+logger = logging.getLogger(__name__)
+
+PHOTO_MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # 10 MB
+PHOTO_UPLOAD_WORKERS = 4
+
+STATUS_CREATED = "created"
+STATUS_DUPLICATE = "duplicate"
+STATUS_REJECTED = "rejected"
+STATUS_FAILED = "failed"
+
+# Сигнатуры (magic bytes) допустимых форматов; WEBP проверяется отдельно (RIFF....WEBP)
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+)
+
+
+@dataclass
+class IngestResult:
+    """Результат загрузки одного файла."""
+
+    name: str
+    status: str
+    photo: Optional[Photo] = None
+    error: str = ""
+
+    @property
+    def ok(self) -> bool:
+        return self.status in (STATUS_CREATED, STATUS_DUPLICATE)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "status": self.status,
+            "photo_id": self.photo.pk if self.photo else None,
+            "error": self.error,
+        }
+
+
+def validate_upload_size(size: int) -> None:
+    """Проверяет размер загружаемого файла (до получения его содержимого)."""
+    max_size = getattr(settings, "PHOTO_MAX_UPLOAD_SIZE", PHOTO_MAX_UPLOAD_SIZE)
+    if size > max_size:
+        raise ValidationError(
+            f"Размер файла не может превышать {max_size // (1024 * 1024)} MB."
+        )
+
+
+def sniff_image_format(head: bytes) -> Optional[str]:
+    """Определяет формат по первым байтам файла, не доверяя имени и Content-Type."""
+    for signature, image_format in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return image_format
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    return None
+
+
+def validate_image_header(image_file: Any) -> Tuple[str, int, int]:
+    """
+    Проверяет настоящий формат и размеры изображения по заголовку.
+
+    Читаются только сигнатура и заголовок, пиксели не декодируются, поэтому
+    переименованные файлы и decompression bomb отклоняются до загрузки в хранилище.
+    Возвращает формат, ширину и высоту.
+    """
+    image_file.seek(0)
+    image_format = sniff_image_format(image_file.read(12))
+    if image_format is None:
+        image_file.seek(0)
+        raise ValidationError("Разрешены только форматы JPEG, PNG, WEBP.")
+
+    image_file.seek(0)
+    try:
+        with Image.open(image_file, formats=[image_format]) as img:
+            width, height = img.size
+    except Image.DecompressionBombError as e:
+        raise ValidationError("Изображение слишком большое.") from e
+    except Exception as e:
+        raise ValidationError("Файл повреждён или не является изображением.") from e
+    finally:
+        image_file.seek(0)
+
+    max_pixels = getattr(settings, "IMAGE_MAX_PIXELS", IMAGE_MAX_PIXELS)
+    if max_pixels and width * height > max_pixels:
+        raise ValidationError(
+            f"Изображение слишком большое: {width}×{height} пикселей "
+            f"(не более {max_pixels} пикселей)."
+        )
+    return image_format, width, height
+
+
+def validate_photo_upload(image_file: Any) -> None:
+    """Проверяет загружаемый файл до отправки в хранилище."""
+    validate_upload_size(image_file.size)
+    validate_image_header(image_file)
+
+
+def collect_upload_errors(files: Sequence[Any]) -> List[str]:
+    """Ошибки проверки файлов пакета (для форм, где пакет принимается целиком)."""
+    errors = []
+    for image_file in files:
+        try:
+            validate_photo_upload(image_file)
+        except ValidationError as e:
+            errors.append(f"{image_file.name}: {' '.join(e.messages)}")
+    return errors
+
+
+def _owner_keeps_originals(album: Any) -> bool:
+    """Включил ли владелец альбома хранение оригиналов без пережатия."""
+    return bool(
+        UserProfile.objects.filter(user_id=album.user_id)
+        .values_list("keep_original_photos", flat=True)
+        .first()
+    )
+
+
+def _reencode_or_keep(image_file: Any) -> Any:
+    """Пережатый файл или исходный, если пережимать не нужно или не удалось."""
+    try:
+        return reencode_photo(image_file) or image_file
+    except Exception:  # pylint: disable=broad-exception-caught
+        logger.exception("Error re-encoding %s", image_file.name)
+        image_file.seek(0)
+        return image_file
+
+
+def _upload_executor(task_count: int) -> ThreadPoolExecutor:
+    workers = getattr(settings, "PHOTO_UPLOAD_WORKERS", PHOTO_UPLOAD_WORKERS)
+    return ThreadPoolExecutor(
+        max_workers=max(1, min(workers, task_count)), thread_name_prefix="photo-upload"
+    )
+
+
+def _build_thumbnails(image_file: Any) -> Dict[str, Any]:
+    try:
+        return build_photo_thumbnails(image_file)
+    except Exception:  # pylint: disable=broad-exception-caught
+        # Фото без миниатюр остаётся рабочим: шаблоны откатываются на оригинал
+        logger.exception("Error creating thumbnails for %s", image_file.name)
+        return {}
+
+
+def _storage_names(photo: Photo, files: Dict[str, Any]) -> Dict[str, Tuple[str, Any]]:
+    """
+    Имена в хранилище для файлов полей фото. upload_to читает album.user,
+    поэтому имена вычисляются в основном потоке, а не в пуле загрузки.
+    """
+    return {
+        field_name: (photo._meta.get_field(field_name).generate_filename(photo, content.name), content)
+        for field_name, content in files.items()
+    }
+
+
+def _store_photo_files(photo: Photo, files: Dict[str, Tuple[str, Any]]) -> Photo:
+    """Отправляет файлы в хранилище под готовыми именами; к БД не обращается."""
+    for field_name, (name, content) in files.items():
+        field = photo._meta.get_field(field_name)
+        setattr(photo, field_name, field.storage.save(name, content, max_length=field.max_length))
+    return photo
+
+
+def _delete_stored_files(photos: Sequence[Photo]) -> None:
+    for photo in photos:
+        for field_name in PHOTO_FILE_FIELDS:
+            field_file = getattr(photo, field_name)
+            if field_file.name:
+                field_file.storage.delete(field_file.name)
+
+
+def ingest_photos(album: Any, files: Sequence[Any], **fields: Any) -> List[IngestResult]:
+    """
+    Загружает пакет файлов в альбом и возвращает результат для каждого файла.
+
+    Файлы, не прошедшие проверку, отклоняются до обращений к хранилищу.
+    Файлы, уже загруженные владельцем альбома (совпадает SHA-256), повторно
+    не отправляются: новая запись ссылается на существующий файл.
+    """
+    results = [IngestResult(name=image_file.name, status=STATUS_CREATED) for image_file in files]
+
+    # 1. Проверка всех файлов
+    for result, image_file in zip(results, files):
+        try:
+            validate_photo_upload(image_file)
+        except ValidationError as e:
+            result.status = STATUS_REJECTED
+            result.error = " ".join(e.messages)
+
+    # 2. Пережатие (до хэша: дубликаты ищутся по тем байтам, которые будут сохранены),
+    # метаданные и поиск уже сохранённых копий
+    accepted = [(r, f) for r, f in zip(results, files) if r.status != STATUS_REJECTED]
+    max_edge = getattr(settings, "PHOTO_INGEST_MAX_EDGE", PHOTO_INGEST_MAX_EDGE)
+    if accepted and max_edge and not _owner_keeps_originals(album):
+        with _upload_executor(len(accepted)) as executor:
+            prepared = list(executor.map(_reencode_or_keep, [f for _, f in accepted]))
+        accepted = [(r, f) for (r, _), f in zip(accepted, prepared)]
+    metadata = {id(f): extract_image_metadata(f) for _, f in accepted}
+    hashes = {m["content_hash"] for m in metadata.values() if m["content_hash"]}
+    stored: Dict[str, Photo] = {}
+    existing = (
+        Photo.objects.filter(album__user=album.user, content_hash__in=hashes)
+        .exclude(image="")
+        .order_by("-pk")
+    )
+    for photo in existing:
+        stored[photo.content_hash] = photo
+
+    # Первый файл с новым хэшем загружается, остальные ссылаются на него
+    to_upload: List[Any] = []
+    duplicates: List[Any] = []
+    seen_hashes = set()
+    for result, image_file in accepted:
+        content_hash = metadata[id(image_file)]["content_hash"]
+        if content_hash in stored or content_hash in seen_hashes:
+            result.status = STATUS_DUPLICATE
+            duplicates.append((result, image_file))
+        else:
+            seen_hashes.add(content_hash)
+            to_upload.append((result, image_file))
+
+    # 3. Миниатюры и отправка в хранилище в пуле потоков. Задачи пула не
+    # обращаются к ORM: имена файлов (upload_to) вычисляются здесь, между этапами
+    for result, image_file in to_upload:
+        result.photo = Photo(album=album, **{**metadata[id(image_file)], **fields})
+    if to_upload:
+        with _upload_executor(len(to_upload)) as executor:
+            thumbnails = list(executor.map(_build_thumbnails, [f for _, f in to_upload]))
+            files_to_store = [
+                _storage_names(result.photo, {"image": image_file, **thumbs})
+                for (result, image_file), thumbs in zip(to_upload, thumbnails)
+            ]
+            futures = [
+                executor.submit(_store_photo_files, result.photo, photo_files)
+                for (result, _), photo_files in zip(to_upload, files_to_store)
+            ]
+            for (result, _), future in zip(to_upload, futures):
+                try:
+                    future.result()
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    result.status = STATUS_FAILED
+                    result.error = str(e)
+                    result.photo = None
+
+    for result, image_file in to_upload:
+        if result.photo is not None:
+            stored.setdefault(result.photo.content_hash, result.photo)
+    for result, image_file in duplicates:
+        source = stored.get(metadata[id(image_file)]["content_hash"])
+        if source is None:
+            # Единственная загрузка с этим хэшем в пакете не удалась
+            result.status = STATUS_FAILED
+            result.error = "Не удалось сохранить файл."
+            continue
+        result.photo = Photo(album=album, **copy_photo_files(source, **fields))
+
+    # 4. Пакетная вставка записей и истории в одной транзакции
+    new_photos = [result.photo for result in results if result.photo is not None]
+    if not new_photos:
+        return results
+    uploaded = [result.photo for result, _ in to_upload if result.photo is not None]
+    try:
+        with transaction.atomic():
+            created = bulk_create_with_history(new_photos, Photo)
+            # bulk_create не отправляет post_save, поэтому кэш коллажей сбрасываем явно
+            clear_collage_cache(album.pk)
+    except Exception:
+        _delete_stored_files(uploaded)
+        raise
+
+    created_iter = iter(created)
+    for result in results:
+        if result.photo is not None:
+            result.photo = next(created_iter)
+    return results
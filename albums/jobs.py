@@ -0,0 +1,78 @@
+"""
+Фоновые задачи приложения.
+
+Очередь хранится в таблицах БД, поэтому внешний брокер не нужен: задачи
+забирает процесс `python manage.py run_worker`. Захват задачи выполняется
+условным UPDATE, так что несколько воркеров не возьмут одну задачу дважды.
+"""
+
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import CollageJob, ExportJob
+from .utils import get_collage_photos, get_or_create_collage
+
+# Через сколько секунд задача в статусе running считается брошенной
+JOB_STALE_AFTER = 15 * 60
+
+
+def claim_next_collage_job() -> Optional[CollageJob]:
+    """Забирает самую старую задачу из очереди и переводит её в running."""
+    queued = CollageJob.objects.filter(status=CollageJob.STATUS_QUEUED).order_by("created_at")
+    for job_id in queued.values_list("id", flat=True)[:10]:
+        claimed = CollageJob.objects.filter(pk=job_id, status=CollageJob.STATUS_QUEUED).update(
+            status=CollageJob.STATUS_RUNNING, started_at=timezone.now()
+        )
+        if claimed:
+            return CollageJob.objects.select_related("album").get(pk=job_id)
+    return None
+
+
+def run_collage_job(job: CollageJob) -> CollageJob:
+    """Собирает коллаж для задачи и сохраняет результат или текст ошибки."""
+    try:
+        photos = get_collage_photos(job.album)
+        if not photos.exists():
+            raise ValueError("No photos in album to generate collage")
+
+        collage, _ = get_or_create_collage(
+            job.album, photos, cell_size=job.cell_size, output_format=job.output_format
+        )
+        if collage is None:
+            raise ValueError("Failed to generate collage")
+
+        job.collage = collage
+        job.status = CollageJob.STATUS_DONE
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        job.status = CollageJob.STATUS_FAILED
+        job.error = str(e)
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=["collage", "status", "error", "finished_at"])
+    return job
+
+
+def requeue_stale_jobs() -> int:
+    """Возвращает в очередь задачи, воркер которых завершился, не закончив работу."""
+    stale_after = getattr(settings, "JOB_STALE_AFTER", JOB_STALE_AFTER)
+    deadline = timezone.now() - timedelta(seconds=stale_after)
+    requeued = 0
+    for model in (CollageJob, ExportJob):
+        requeued += model.objects.filter(
+            status=model.STATUS_RUNNING, started_at__lt=deadline
+        ).update(status=model.STATUS_QUEUED, started_at=None)
+    return requeued
+
+
+def process_pending_jobs() -> int:
+    """Выполняет все задачи из очереди и возвращает их количество."""
+    processed = 0
+    while True:
+        job = claim_next_collage_job()
+        if job is None:
+            return processed
+        run_collage_job(job)
+        processed += 1
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from albums.models import Photo
+from albums.utils import extract_image_metadata
+
+
+class Command(BaseCommand):
+    help = "Заполняет размеры, размер файла, MIME-тип и SHA-256 у фото, загруженных до их появления."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=200, help="Сколько фото обрабатывать за один запрос."
+        )
+
+    def handle(self, *args, **options):
+        pending = Photo.objects.filter(content_hash="").order_by("pk")
+        updated = 0
+        last_pk = 0
+        while True:
+            batch = list(pending.filter(pk__gt=last_pk)[: options["batch_size"]])
+            if not batch:
+                break
+            for photo in batch:
+                last_pk = photo.pk
+                try:
+                    with photo.image.open() as image_file:
+                        metadata = extract_image_metadata(image_file)
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    self.stderr.write(f"Photo {photo.pk}: {e}")
+                    continue
+                # update() не трогает историю и сигналы: метаданные не меняют фото
+                Photo.objects.filter(pk=photo.pk).update(**metadata)
+                updated += 1
+        self.stdout.write(f"Updated {updated} photo(s)")
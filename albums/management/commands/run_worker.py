@@ -0,0 +1,47 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from albums.exports import cleanup_export_jobs, process_pending_export_jobs
+from albums.jobs import process_pending_jobs, requeue_stale_jobs
+from albums.uploads import cleanup_upload_sessions
+
+
+class Command(BaseCommand):
+    help = "Запускает фоновый воркер, выполняющий задачи из очереди в БД (коллажи, экспорт)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Выполнить задачи, которые уже в очереди, и завершиться.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=getattr(settings, "JOB_POLL_INTERVAL", 2.0),
+            help="Пауза между опросами очереди, секунд.",
+        )
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} stale job(s)")
+
+        while True:
+            # Долгоживущий процесс: не держим протухшие соединения с БД между опросами
+            close_old_connections()
+            processed = process_pending_jobs() + process_pending_export_jobs()
+            if processed:
+                self.stdout.write(f"Processed {processed} job(s)")
+            expired = cleanup_upload_sessions()
+            if expired:
+                self.stdout.write(f"Removed {expired} expired upload session(s)")
+            expired = cleanup_export_jobs()
+            if expired:
+                self.stdout.write(f"Removed {expired} expired export(s)")
+            if options["once"]:
+                return
+            time.sleep(options["interval"])
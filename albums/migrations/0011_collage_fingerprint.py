@@ -0,0 +1,38 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('albums', '0010_alter_album_options_alter_bugreport_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='album',
+            options={'ordering': ['-created_at'], 'verbose_name': 'Альбом', 'verbose_name_plural': 'Альбомы'},
+        ),
+        migrations.AlterModelOptions(
+            name='collage',
+            options={'ordering': ['-created_at'], 'verbose_name': 'Коллаж', 'verbose_name_plural': 'Коллажи'},
+        ),
+        migrations.AlterModelOptions(
+            name='photo',
+            options={'ordering': ['-created_at'], 'verbose_name': 'Фотография', 'verbose_name_plural': 'Фотографии'},
+        ),
+        migrations.AlterModelOptions(
+            name='userprofile',
+            options={'ordering': ['user__username'], 'verbose_name': 'Профиль пользователя', 'verbose_name_plural': 'Профили пользователей'},
+        ),
+        migrations.AddField(
+            model_name='collage',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64, verbose_name='Отпечаток'),
+        ),
+        migrations.AddIndex(
+            model_name='collage',
+            index=models.Index(fields=['album', 'fingerprint'], name='collage_album_fp_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:19
+
+import albums.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('albums', '0012_collagejob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicalphoto',
+            name='thumbnail_medium',
+            field=models.TextField(blank=True, editable=False, max_length=500, verbose_name='Превью 1024px'),
+        ),
+        migrations.AddField(
+            model_name='historicalphoto',
+            name='thumbnail_small',
+            field=models.TextField(blank=True, editable=False, max_length=500, verbose_name='Миниатюра 256px'),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='thumbnail_medium',
+            field=models.ImageField(blank=True, editable=False, max_length=500, upload_to=albums.models.photo_thumbnail_directory_path, verbose_name='Превью 1024px'),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='thumbnail_small',
+            field=models.ImageField(blank=True, editable=False, max_length=500, upload_to=albums.models.photo_thumbnail_directory_path, verbose_name='Миниатюра 256px'),
+        ),
+    ]
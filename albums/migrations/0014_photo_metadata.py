@@ -0,0 +1,67 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('albums', '0013_photo_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicalphoto',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64, verbose_name='SHA-256'),
+        ),
+        migrations.AddField(
+            model_name='historicalphoto',
+            name='file_size',
+            field=models.PositiveBigIntegerField(blank=True, db_index=True, editable=False, null=True, verbose_name='Размер файла (байт)'),
+        ),
+        migrations.AddField(
+            model_name='historicalphoto',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Высота'),
+        ),
+        migrations.AddField(
+            model_name='historicalphoto',
+            name='mime_type',
+            field=models.CharField(blank=True, editable=False, max_length=50, verbose_name='MIME-тип'),
+        ),
+        migrations.AddField(
+            model_name='historicalphoto',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Ширина'),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64, verbose_name='SHA-256'),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='file_size',
+            field=models.PositiveBigIntegerField(blank=True, db_index=True, editable=False, null=True, verbose_name='Размер файла (байт)'),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Высота'),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='mime_type',
+            field=models.CharField(blank=True, editable=False, max_length=50, verbose_name='MIME-тип'),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Ширина'),
+        ),
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['width', 'height'], name='photo_dimensions_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('albums', '0015_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='keep_original_photos',
+            field=models.BooleanField(default=False, help_text='Не уменьшать и не пережимать фотографии при загрузке.', verbose_name='Хранить оригиналы фото'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 6.0.1 on 2026-10-18 13:05
+
+from django.db import migrations
+
+from albums.search import (
+    POSTGRES_SETUP,
+    POSTGRES_TEARDOWN,
+    SQLITE_FTS_SETUP,
+    SQLITE_FTS_TEARDOWN,
+)
+
+
+def _run(schema_editor, statements):
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute('PRAGMA compile_options')
+            options = {row[0] for row in cursor.fetchall()}
+        # Без FTS5 поиск останется на icontains
+        if 'ENABLE_FTS5' in options:
+            _run(schema_editor, SQLITE_FTS_SETUP)
+    elif vendor == 'postgresql':
+        _run(schema_editor, POSTGRES_SETUP)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        _run(schema_editor, SQLITE_FTS_TEARDOWN)
+    elif vendor == 'postgresql':
+        _run(schema_editor, POSTGRES_TEARDOWN)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('albums', '0017_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:49
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_last_seen(apps, schema_editor):
+    BugReport = apps.get_model('albums', 'BugReport')
+    BugReport.objects.update(last_seen_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('albums', '0019_exportjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bugreport',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64, verbose_name='Отпечаток'),
+        ),
+        migrations.AddField(
+            model_name='bugreport',
+            name='last_seen_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Последний раз'),
+        ),
+        migrations.AddField(
+            model_name='bugreport',
+            name='occurrences',
+            field=models.PositiveIntegerField(default=1, verbose_name='Повторений'),
+        ),
+        migrations.RunPython(backfill_last_seen, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='bugreport',
+            index=models.Index(fields=['-last_seen_at'], name='bugreport_last_seen_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='bugreport',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'open'), models.Q(('fingerprint', ''), _negated=True)), fields=('fingerprint',), name='bugreport_open_fingerprint_uniq'),
+        ),
+    ]
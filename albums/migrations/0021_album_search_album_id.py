@@ -0,0 +1,75 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:12
+
+from django.db import migrations
+
+# Индекс из 0018 был связан с albums_album по rowid, который SQLite меняет
+# при пересоздании таблицы. Новый индекс хранит первичный ключ альбома.
+OLD_SQLITE_FTS_TEARDOWN = [
+    'DROP TRIGGER IF EXISTS albums_album_fts_ai',
+    'DROP TRIGGER IF EXISTS albums_album_fts_ad',
+    'DROP TRIGGER IF EXISTS albums_album_fts_au',
+    'DROP TABLE IF EXISTS albums_album_fts',
+]
+
+SQLITE_FTS_SETUP = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS albums_album_fts USING fts5(
+        album_id UNINDEXED, title, description,
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS albums_album_fts_ai AFTER INSERT ON albums_album BEGIN
+        INSERT INTO albums_album_fts(album_id, title, description)
+        VALUES (new.id, new.title, coalesce(new.description, ''));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS albums_album_fts_ad AFTER DELETE ON albums_album BEGIN
+        DELETE FROM albums_album_fts WHERE album_id = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS albums_album_fts_au AFTER UPDATE OF title, description
+    ON albums_album BEGIN
+        UPDATE albums_album_fts
+        SET title = new.title, description = coalesce(new.description, '')
+        WHERE album_id = old.id;
+    END
+    """,
+    """
+    INSERT INTO albums_album_fts(album_id, title, description)
+    SELECT id, title, coalesce(description, '') FROM albums_album
+    """,
+]
+
+
+def _fts5_available(schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return 'ENABLE_FTS5' in {row[0] for row in cursor.fetchall()}
+
+
+def rebuild_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite' or not _fts5_available(schema_editor):
+        return
+    for statement in OLD_SQLITE_FTS_TEARDOWN + SQLITE_FTS_SETUP:
+        schema_editor.execute(statement)
+
+
+def drop_search_table(apps, schema_editor):
+    # Без таблицы поиск работает через icontains; 0018 при откате тоже только удаляет
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in OLD_SQLITE_FTS_TEARDOWN:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('albums', '0020_bugreport_grouping'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_search_table, drop_search_table),
+    ]
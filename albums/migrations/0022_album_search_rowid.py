@@ -0,0 +1,78 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:12
+
+from django.db import migrations
+
+# В 0021 строки индекса искались по неиндексируемому album_id, то есть
+# перебором всей таблицы при каждом сохранении альбома. Теперь строка индекса
+# хранится под rowid альбома; после пересоздания albums_album её перестраивает
+# albums.search.ensure_search_index (post_migrate).
+SQLITE_FTS_TEARDOWN = [
+    'DROP TRIGGER IF EXISTS albums_album_fts_ai',
+    'DROP TRIGGER IF EXISTS albums_album_fts_ad',
+    'DROP TRIGGER IF EXISTS albums_album_fts_au',
+    'DROP TABLE IF EXISTS albums_album_fts',
+]
+
+SQLITE_FTS_SETUP = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS albums_album_fts USING fts5(
+        title, description,
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS albums_album_fts_ai AFTER INSERT ON albums_album BEGIN
+        INSERT INTO albums_album_fts(rowid, title, description)
+        VALUES (new.rowid, new.title, coalesce(new.description, ''));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS albums_album_fts_ad AFTER DELETE ON albums_album BEGIN
+        DELETE FROM albums_album_fts WHERE rowid = old.rowid;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS albums_album_fts_au AFTER UPDATE OF title, description
+    ON albums_album
+    WHEN old.title IS NOT new.title OR old.description IS NOT new.description BEGIN
+        UPDATE albums_album_fts
+        SET title = new.title, description = coalesce(new.description, '')
+        WHERE rowid = old.rowid;
+    END
+    """,
+    """
+    INSERT INTO albums_album_fts(rowid, title, description)
+    SELECT rowid, title, coalesce(description, '') FROM albums_album
+    """,
+]
+
+
+def _fts5_available(schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return 'ENABLE_FTS5' in {row[0] for row in cursor.fetchall()}
+
+
+def key_search_table_by_rowid(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite' or not _fts5_available(schema_editor):
+        return
+    for statement in SQLITE_FTS_TEARDOWN + SQLITE_FTS_SETUP:
+        schema_editor.execute(statement)
+
+
+def drop_search_table(apps, schema_editor):
+    # Без таблицы поиск работает через icontains, как и после отката 0021
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in SQLITE_FTS_TEARDOWN:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('albums', '0021_album_search_album_id'),
+    ]
+
+    operations = [
+        migrations.RunPython(key_search_table_by_rowid, drop_search_table),
+    ]
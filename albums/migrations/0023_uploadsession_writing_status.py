@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('albums', '0022_album_search_rowid'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='uploadsession',
+            name='status',
+            field=models.CharField(choices=[('active', 'Active'), ('writing', 'Writing'), ('processing', 'Processing'), ('complete', 'Complete'), ('failed', 'Failed')], default='active', max_length=20, verbose_name='Статус'),
+        ),
+    ]
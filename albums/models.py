@@ -2,7 +2,9 @@ import os
 import uuid
 from typing import Any
 
+from django.core.files.storage import default_storage, storages
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 from cloudinary.models import CloudinaryField
 from simple_history.models import HistoricalRecords
@@ -16,6 +18,11 @@ class UserProfile(models.Model):
     bio = models.TextField(max_length=500, blank=True, verbose_name="О себе")
     location = models.CharField(max_length=30, blank=True, verbose_name="Местоположение")
     birth_date = models.DateField(null=True, blank=True, verbose_name="Дата рождения")
+    keep_original_photos = models.BooleanField(
+        default=False,
+        verbose_name="Хранить оригиналы фото",
+        help_text="Не уменьшать и не пережимать фотографии при загрузке.",
+    )
 
     def __str__(self):
         return f"{self.user.username}'s profile"
@@ -41,6 +48,11 @@ def photo_directory_path(instance: Any, filename: str) -> str:
     return get_album_media_path(instance.album.user.id, instance.album.id, "photos", filename)
 
 
+def photo_thumbnail_directory_path(instance: Any, filename: str) -> str:
+    """Путь для загрузки миниатюр фотографий."""
+    return get_album_media_path(instance.album.user.id, instance.album.id, "thumbnails", filename)
+
+
 def collage_directory_path(instance: Any, filename: str) -> str:
     """Путь для загрузки коллажей."""
     return get_album_media_path(instance.album.user.id, instance.album.id, "collages", filename)
@@ -64,10 +76,32 @@ class Album(models.Model):
     def __str__(self):
         return f"{self.title} ({self.user.username})"
 
+    @property
+    def cover_url(self) -> str:
+        """
+        URL обложки альбома по аннотациям cover_thumbnail и cover_image
+        (см. DashboardView.get_queryset); пустая строка, если фото нет.
+        """
+        name = getattr(self, "cover_thumbnail", "") or getattr(self, "cover_image", "")
+        return default_storage.url(name) if name else ""
+
     class Meta:
         verbose_name = "Альбом"
         ordering = ["-created_at"]
         verbose_name_plural = "Альбомы"
+        indexes = [
+            # Список альбомов пользователя (дашборд, API) в порядке по умолчанию
+            models.Index(fields=["user", "-created_at"], name="album_user_created_idx"),
+            # Проверка уникального названия (validate_title, duplicate_album)
+            models.Index(fields=["user", "title"], name="album_user_title_idx"),
+            # Ветка is_public в advanced_search: (user = me) OR (is_public).
+            # Частичный индекс: фильтр по булеву полю Django пишет как WHERE "is_public"
+            models.Index(
+                fields=["-created_at"],
+                condition=models.Q(is_public=True),
+                name="album_public_created_idx",
+            ),
+        ]
 
 
 class Photo(models.Model):
@@ -77,6 +111,31 @@ class Photo(models.Model):
     image = models.ImageField(
         upload_to=photo_directory_path, max_length=500, verbose_name="Изображение"
     )
+    # Производные размеры для сеток и просмотра, создаются при загрузке
+    thumbnail_small = models.ImageField(
+        upload_to=photo_thumbnail_directory_path,
+        max_length=500,
+        blank=True,
+        editable=False,
+        verbose_name="Миниатюра 256px",
+    )
+    thumbnail_medium = models.ImageField(
+        upload_to=photo_thumbnail_directory_path,
+        max_length=500,
+        blank=True,
+        editable=False,
+        verbose_name="Превью 1024px",
+    )
+    # Метаданные файла извлекаются один раз при загрузке
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name="Ширина")
+    height = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name="Высота")
+    file_size = models.PositiveBigIntegerField(
+        null=True, blank=True, editable=False, db_index=True, verbose_name="Размер файла (байт)"
+    )
+    mime_type = models.CharField(max_length=50, blank=True, editable=False, verbose_name="MIME-тип")
+    content_hash = models.CharField(
+        max_length=64, blank=True, editable=False, db_index=True, verbose_name="SHA-256"
+    )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     is_favorite = models.BooleanField(
         default=False, verbose_name="Избранное"
@@ -93,10 +152,40 @@ class Photo(models.Model):
     def __str__(self):
         return f"Photo {self.id} in {self.album.title}"
 
+    @property
+    def thumbnail_url(self) -> str:
+        """URL миниатюры для сеток; для старых фото без миниатюр — оригинал."""
+        return self.thumbnail_small.url if self.thumbnail_small else self.image.url
+
+    @property
+    def preview_url(self) -> str:
+        """URL превью для просмотра одной фотографии."""
+        return self.thumbnail_medium.url if self.thumbnail_medium else self.image.url
+
+    @property
+    def srcset(self) -> str:
+        """Значение атрибута srcset из доступных миниатюр."""
+        candidates = [
+            (self.thumbnail_small, 256),
+            (self.thumbnail_medium, 1024),
+        ]
+        return ", ".join(f"{field.url} {width}w" for field, width in candidates if field)
+
     class Meta:
         verbose_name = "Фотография"
         ordering = ["-created_at"]
         verbose_name_plural = "Фотографии"
+        indexes = [
+            models.Index(fields=["width", "height"], name="photo_dimensions_idx"),
+            # Фото альбома в порядке по умолчанию и keyset-пагинация по (created_at, id)
+            models.Index(fields=["album", "-created_at", "-id"], name="photo_album_created_idx"),
+            # Лучшие снимки альбома для коллажа (get_collage_photos), частичный индекс
+            models.Index(
+                fields=["album", "-created_at"],
+                condition=models.Q(is_favorite=True),
+                name="photo_album_fav_idx",
+            ),
+        ]
 
 
 class Collage(models.Model):
@@ -106,6 +195,10 @@ class Collage(models.Model):
     image = models.ImageField(
         upload_to=collage_directory_path, max_length=500, verbose_name="Изображение"
     )
+    # Отпечаток входных данных (фото, размер ячейки, формат) для повторного использования
+    fingerprint = models.CharField(
+        max_length=64, blank=True, default="", editable=False, verbose_name="Отпечаток"
+    )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
 
     def __str__(self):
@@ -115,6 +208,138 @@ class Collage(models.Model):
         ordering = ["-created_at"]
         verbose_name = "Коллаж"
         verbose_name_plural = "Коллажи"
+        indexes = [
+            models.Index(fields=["album", "fingerprint"], name="collage_album_fp_idx"),
+        ]
+
+
+class CollageJob(models.Model):
+    """Задача фоновой генерации коллажа (очередь в БД, без внешнего брокера)."""
+
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, verbose_name="ID")
+    album = models.ForeignKey(
+        Album, on_delete=models.CASCADE, related_name="collage_jobs", verbose_name="Альбом"
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        related_name="collage_jobs",
+        null=True,
+        blank=True,
+        verbose_name="Пользователь",
+    )
+    status = models.CharField(
+        max_length=20,
+        default=STATUS_QUEUED,
+        choices=[
+            (STATUS_QUEUED, "Queued"),
+            (STATUS_RUNNING, "Running"),
+            (STATUS_DONE, "Done"),
+            (STATUS_FAILED, "Failed"),
+        ],
+        verbose_name="Статус",
+    )
+    cell_size = models.PositiveIntegerField(default=300, verbose_name="Размер ячейки")
+    output_format = models.CharField(max_length=10, default="JPEG", verbose_name="Формат")
+    collage = models.ForeignKey(
+        Collage,
+        on_delete=models.SET_NULL,
+        related_name="jobs",
+        null=True,
+        blank=True,
+        verbose_name="Коллаж",
+    )
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Начало")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Завершение")
+
+    def __str__(self):
+        return f"CollageJob {self.id} ({self.status})"
+
+    class Meta:
+        ordering = ["created_at"]
+        verbose_name = "Задача коллажа"
+        verbose_name_plural = "Задачи коллажей"
+        indexes = [
+            models.Index(fields=["status", "created_at"], name="collagejob_status_idx"),
+        ]
+
+
+class UploadSession(models.Model):
+    """
+    Возобновляемая загрузка одного файла по частям.
+
+    Части дописываются во временный файл на диске по смещению; после
+    завершения файл проходит общий конвейер загрузки (albums.ingest).
+    """
+
+    STATUS_ACTIVE = "active"
+    # Часть файла переносится в файл сессии; другие части и завершение ждут
+    STATUS_WRITING = "writing"
+    STATUS_PROCESSING = "processing"
+    STATUS_COMPLETE = "complete"
+    STATUS_FAILED = "failed"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, verbose_name="ID")
+    album = models.ForeignKey(
+        Album, on_delete=models.CASCADE, related_name="upload_sessions", verbose_name="Альбом"
+    )
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="upload_sessions", verbose_name="Пользователь"
+    )
+    idempotency_key = models.CharField(
+        max_length=255, blank=True, default="", verbose_name="Ключ идемпотентности"
+    )
+    filename = models.CharField(max_length=255, verbose_name="Имя файла")
+    total_size = models.PositiveBigIntegerField(verbose_name="Размер файла (байт)")
+    received_bytes = models.PositiveBigIntegerField(default=0, verbose_name="Получено (байт)")
+    status = models.CharField(
+        max_length=20,
+        default=STATUS_ACTIVE,
+        choices=[
+            (STATUS_ACTIVE, "Active"),
+            (STATUS_WRITING, "Writing"),
+            (STATUS_PROCESSING, "Processing"),
+            (STATUS_COMPLETE, "Complete"),
+            (STATUS_FAILED, "Failed"),
+        ],
+        verbose_name="Статус",
+    )
+    photo = models.ForeignKey(
+        Photo,
+        on_delete=models.SET_NULL,
+        related_name="upload_sessions",
+        null=True,
+        blank=True,
+        verbose_name="Фото",
+    )
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+
+    def __str__(self):
+        return f"UploadSession {self.id} ({self.received_bytes}/{self.total_size})"
+
+    class Meta:
+        ordering = ["created_at"]
+        verbose_name = "Сессия загрузки"
+        verbose_name_plural = "Сессии загрузки"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "idempotency_key"],
+                condition=~models.Q(idempotency_key=""),
+                name="uploadsession_user_key_uniq",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["status", "updated_at"], name="uploadsession_status_idx"),
+        ]
 
 
 class BugReport(models.Model):
@@ -135,6 +360,13 @@ class BugReport(models.Model):
         choices=[("open", "Open"), ("closed", "Closed")],
         verbose_name="Статус",
     )
+    # Автоматические отчёты группируются по отпечатку (тип исключения + стек):
+    # повтор той же ошибки увеличивает счётчик открытого отчёта, а не создаёт новый
+    fingerprint = models.CharField(
+        max_length=64, blank=True, default="", editable=False, verbose_name="Отпечаток"
+    )
+    occurrences = models.PositiveIntegerField(default=1, verbose_name="Повторений")
+    last_seen_at = models.DateTimeField(default=timezone.now, verbose_name="Последний раз")
 
     def __str__(self):
         return f"Bug: {self.title} ({self.status})"
@@ -143,3 +375,82 @@ class BugReport(models.Model):
     class Meta:
         verbose_name = "Сообщение об ошибке"
         verbose_name_plural = "Сообщения об ошибках"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["fingerprint"],
+                condition=models.Q(status="open") & ~models.Q(fingerprint=""),
+                name="bugreport_open_fingerprint_uniq",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["-last_seen_at"], name="bugreport_last_seen_idx"),
+        ]
+
+
+def export_storage() -> Any:
+    """Хранилище файлов экспорта (STORAGES["exports"]): xlsx/csv — не изображения."""
+    return storages["exports"]
+
+
+def export_directory_path(instance: Any, filename: str) -> str:
+    """Путь для файлов экспорта."""
+    return f"exports/user_{instance.user_id}/{instance.id}/{filename}"
+
+
+class ExportJob(models.Model):
+    """
+    Отложенный экспорт таблицы в файл (очередь в БД, как у CollageJob).
+
+    Файл собирает фоновый воркер и сохраняет в хранилище exports; до
+    expires_at повтор того же экспорта (fingerprint) отдаёт готовый файл.
+    """
+
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, verbose_name="ID")
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="export_jobs", verbose_name="Пользователь"
+    )
+    kind = models.CharField(max_length=30, verbose_name="Отчёт")
+    export_format = models.CharField(max_length=10, default="xlsx", verbose_name="Формат")
+    params = models.JSONField(default=dict, blank=True, verbose_name="Параметры")
+    fingerprint = models.CharField(max_length=64, verbose_name="Отпечаток запроса")
+    status = models.CharField(
+        max_length=20,
+        default=STATUS_QUEUED,
+        choices=[
+            (STATUS_QUEUED, "Queued"),
+            (STATUS_RUNNING, "Running"),
+            (STATUS_DONE, "Done"),
+            (STATUS_FAILED, "Failed"),
+        ],
+        verbose_name="Статус",
+    )
+    file = models.FileField(
+        upload_to=export_directory_path,
+        storage=export_storage,
+        max_length=500,
+        blank=True,
+        verbose_name="Файл",
+    )
+    file_size = models.PositiveBigIntegerField(null=True, blank=True, verbose_name="Размер файла")
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Начало")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Завершение")
+    expires_at = models.DateTimeField(null=True, blank=True, verbose_name="Хранится до")
+
+    def __str__(self):
+        return f"ExportJob {self.id} {self.kind}.{self.export_format} ({self.status})"
+
+    class Meta:
+        ordering = ["-created_at"]
+        verbose_name = "Задача экспорта"
+        verbose_name_plural = "Задачи экспорта"
+        indexes = [
+            models.Index(fields=["status", "created_at"], name="exportjob_status_idx"),
+            models.Index(fields=["user", "fingerprint"], name="exportjob_fingerprint_idx"),
+        ]
@@ -0,0 +1,143 @@
+"""
+Пагинация списков фотографий.
+
+По умолчанию — обычная постраничная (PageNumberPagination). С параметром
+?pagination=cursor (или ?cursor=...) включается keyset-пагинация по паре
+(created_at, id): страница выбирается условием WHERE по последнему ключу
+предыдущей страницы, без OFFSET и без COUNT(*), поэтому глубокие страницы
+стоят столько же, сколько первая.
+"""
+
+import base64
+import json
+from typing import Any, List, Optional
+
+from django.db.models import Q, QuerySet
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Курсорная пагинация по (created_at, id) от новых к старым."""
+
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    page_size = 20
+    max_page_size = 100
+    invalid_cursor_message = "Invalid cursor"
+
+    def __init__(self, page_size: Optional[int] = None):
+        if page_size:
+            self.page_size = page_size
+        self.base_url = ""
+        self.next_key: Optional[tuple] = None
+        self.previous_key: Optional[tuple] = None
+
+    def get_page_size(self, request: Any) -> int:
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    @staticmethod
+    def encode_cursor(created_at: Any, pk: Any, reverse: bool) -> str:
+        payload = {"c": created_at.isoformat(), "i": pk, "r": int(reverse)}
+        return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+    def decode_cursor(self, request: Any) -> Optional[tuple]:
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            created_at = parse_datetime(payload["c"])
+            if created_at is None:
+                raise ValueError(payload["c"])
+            return created_at, payload["i"], bool(payload["r"])
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError) as e:
+            raise NotFound(self.invalid_cursor_message) from e
+
+    def paginate_queryset(
+        self, queryset: QuerySet, request: Any, view: Any = None
+    ) -> Optional[List[Any]]:
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor[2])
+
+        if cursor is not None:
+            created_at, pk = cursor[0], cursor[1]
+            if reverse:
+                # Назад: записи новее курсора, ближайшие к нему
+                boundary = Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk)
+            else:
+                boundary = Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk)
+            queryset = queryset.filter(boundary)
+
+        ordering = ("created_at", "pk") if reverse else ("-created_at", "-pk")
+        rows = list(queryset.order_by(*ordering)[: page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+
+        self.next_key = self.previous_key = None
+        if rows:
+            first, last = rows[0], rows[-1]
+            # Вперёд можно идти, если дальше есть записи или мы пришли со следующей страницы
+            if has_more or reverse:
+                self.next_key = (last.created_at, last.pk, False)
+            if (has_more and reverse) or (cursor is not None and not reverse):
+                self.previous_key = (first.created_at, first.pk, True)
+        return rows
+
+    def _link(self, key: Optional[tuple]) -> Optional[str]:
+        if key is None:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(*key))
+
+    def get_paginated_response(self, data: Any) -> Response:
+        return Response(
+            {
+                "next": self._link(self.next_key),
+                "previous": self._link(self.previous_key),
+                "results": data,
+            }
+        )
+
+
+class PhotoPagination(PageNumberPagination):
+    """
+    Постраничная пагинация с опциональным keyset-режимом.
+
+    Keyset-режим включается параметром ?pagination=cursor (ссылки next и
+    previous содержат его вместе с курсором) и всегда упорядочивает фото
+    от новых к старым, независимо от ?ordering=.
+    """
+
+    mode_query_param = "pagination"
+
+    def __init__(self):
+        self.keyset: Optional[KeysetPagination] = None
+
+    def is_keyset_requested(self, request: Any) -> bool:
+        return (
+            request.query_params.get(self.mode_query_param) == "cursor"
+            or KeysetPagination.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.is_keyset_requested(request):
+            self.keyset = KeysetPagination(page_size=self.get_page_size(request))
+            return self.keyset.paginate_queryset(queryset, request, view)
+        self.keyset = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,42 @@
+"""
+Рендереры форматов экспорта.
+
+Сам файл экспорта формирует view (см. utils.export_queryset) и возвращает
+готовый потоковый ответ. Рендереры нужны DRF для согласования формата:
+по ?format=csv / ?format=ndjson / ?format=xlsx или заголовку Accept выбирается
+request.accepted_renderer, а ошибки (403, 404) отдаются как JSON.
+"""
+
+from rest_framework.renderers import JSONRenderer
+
+from .utils import XLSX_CONTENT_TYPE
+
+
+class ExportRenderer(JSONRenderer):
+    """Базовый рендерер экспорта: тело ошибок — JSON."""
+
+
+class XlsxRenderer(ExportRenderer):
+    media_type = XLSX_CONTENT_TYPE
+    format = "xlsx"
+
+
+class CsvRenderer(ExportRenderer):
+    media_type = "text/csv"
+    format = "csv"
+
+
+class NdjsonRenderer(ExportRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+
+
+EXPORT_RENDERERS = [JSONRenderer, XlsxRenderer, CsvRenderer, NdjsonRenderer]
+
+
+def requested_export_format(request) -> str:
+    """Формат экспорта по выбранному рендереру; без явного формата — xlsx."""
+    renderer = getattr(request, "accepted_renderer", None)
+    if isinstance(renderer, ExportRenderer):
+        return renderer.format
+    return "xlsx"
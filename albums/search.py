@@ -0,0 +1,230 @@
+"""
+Полнотекстовый поиск по альбомам (название и описание).
+
+SQLite: FTS5-таблица albums_album_fts с копией названия и описания под
+rowid альбома, синхронизируется триггерами на INSERT/UPDATE/DELETE,
+ранжирование — bm25. SQLite пересоздаёт albums_album при изменении схемы:
+rowid при этом меняются, а триггеры удаляются. Поэтому после каждого migrate
+ensure_search_index восстанавливает пропавшие триггеры и перестраивает индекс.
+PostgreSQL: GIN-индекс по to_tsvector('simple', title || ' ' || description),
+ранжирование — ts_rank. Структуры создают миграции 0018_album_search и
+0022_album_search_rowid.
+На других СУБД (или без FTS5) используется прежний поиск через icontains.
+
+Запрос пользователя разбивается на слова; каждое слово ищется как префикс,
+все слова должны встретиться (AND), поэтому поиск работает «по мере ввода».
+"""
+
+import functools
+import re
+from typing import Any, Dict, List
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import BooleanField, Case, FloatField, Q, QuerySet, Value, When
+from django.db.models.expressions import RawSQL
+
+from .models import Album
+
+SQLITE_FTS_TABLE = "albums_album_fts"
+
+# Не больше стольких лучших совпадений на запрос: ранги передаются в запрос
+# альбомов параметрами (см. search_albums)
+SEARCH_MAX_RESULTS = 1000
+
+# Строка индекса хранится под тем же rowid, что и альбом: триггеры находят её
+# по rowid без перебора таблицы. UPDATE альбома переписывает все колонки,
+# поэтому индекс обновляется, только если текст действительно изменился
+SQLITE_FTS_TRIGGERS = {
+    "albums_album_fts_ai": f"""
+    CREATE TRIGGER IF NOT EXISTS albums_album_fts_ai AFTER INSERT ON albums_album BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}(rowid, title, description)
+        VALUES (new.rowid, new.title, coalesce(new.description, ''));
+    END
+    """,
+    "albums_album_fts_ad": f"""
+    CREATE TRIGGER IF NOT EXISTS albums_album_fts_ad AFTER DELETE ON albums_album BEGIN
+        DELETE FROM {SQLITE_FTS_TABLE} WHERE rowid = old.rowid;
+    END
+    """,
+    "albums_album_fts_au": f"""
+    CREATE TRIGGER IF NOT EXISTS albums_album_fts_au AFTER UPDATE OF title, description
+    ON albums_album
+    WHEN old.title IS NOT new.title OR old.description IS NOT new.description BEGIN
+        UPDATE {SQLITE_FTS_TABLE}
+        SET title = new.title, description = coalesce(new.description, '')
+        WHERE rowid = old.rowid;
+    END
+    """,
+}
+
+SQLITE_FTS_REBUILD = [
+    f"DELETE FROM {SQLITE_FTS_TABLE}",
+    f"""
+    INSERT INTO {SQLITE_FTS_TABLE}(rowid, title, description)
+    SELECT rowid, title, coalesce(description, '') FROM albums_album
+    """,
+]
+
+# Одно и то же выражение в индексе и в запросах, иначе PostgreSQL не использует индекс
+POSTGRES_DOCUMENT = (
+    "to_tsvector('simple'::regconfig, coalesce({table}title, '') || ' ' || "
+    "coalesce({table}description, ''))"
+)
+POSTGRES_INDEX = "album_search_gin_idx"
+
+POSTGRES_SETUP = [
+    f"CREATE INDEX IF NOT EXISTS {POSTGRES_INDEX} ON albums_album "
+    f"USING gin ({POSTGRES_DOCUMENT.format(table='')})",
+]
+
+POSTGRES_TEARDOWN = [f"DROP INDEX IF EXISTS {POSTGRES_INDEX}"]
+
+# SQL миграции 0018_album_search (первая схема индекса, заменена в 0021 и 0022).
+# Миграция импортирует эти строки, поэтому менять их нельзя
+SQLITE_FTS_SETUP = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_FTS_TABLE} USING fts5(
+        title, description,
+        content='albums_album', content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS albums_album_fts_ai AFTER INSERT ON albums_album BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}(rowid, title, description)
+        VALUES (new.rowid, new.title, coalesce(new.description, ''));
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS albums_album_fts_ad AFTER DELETE ON albums_album BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, title, description)
+        VALUES ('delete', old.rowid, old.title, coalesce(old.description, ''));
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS albums_album_fts_au AFTER UPDATE OF title, description
+    ON albums_album BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, title, description)
+        VALUES ('delete', old.rowid, old.title, coalesce(old.description, ''));
+        INSERT INTO {SQLITE_FTS_TABLE}(rowid, title, description)
+        VALUES (new.rowid, new.title, coalesce(new.description, ''));
+    END
+    """,
+    f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}) VALUES ('rebuild')",
+]
+
+SQLITE_FTS_TEARDOWN = [
+    "DROP TRIGGER IF EXISTS albums_album_fts_ai",
+    "DROP TRIGGER IF EXISTS albums_album_fts_ad",
+    "DROP TRIGGER IF EXISTS albums_album_fts_au",
+    f"DROP TABLE IF EXISTS {SQLITE_FTS_TABLE}",
+]
+
+
+def search_terms(text: str) -> List[str]:
+    """Слова запроса без операторов FTS (кавычки, звёздочки, NEAR и т.п.)."""
+    return re.findall(r"\w+", text.lower())
+
+
+@functools.lru_cache(maxsize=None)
+def _sqlite_fts_available(alias: str) -> bool:
+    return SQLITE_FTS_TABLE in connections[alias].introspection.table_names()
+
+
+def ensure_search_index(using: str = "default") -> bool:
+    """
+    Восстанавливает триггеры FTS5, удалённые пересозданием albums_album, и
+    перестраивает индекс. True — индекс пришлось перестроить.
+    """
+    _sqlite_fts_available.cache_clear()
+    connection = connections[using]
+    if connection.vendor != "sqlite" or not _sqlite_fts_available(using):
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s",
+            [Album._meta.db_table],
+        )
+        if {row[0] for row in cursor.fetchall()} >= set(SQLITE_FTS_TRIGGERS):
+            return False
+        with transaction.atomic(using=using):
+            for statement in [*SQLITE_FTS_TRIGGERS.values(), *SQLITE_FTS_REBUILD]:
+                cursor.execute(statement)
+    return True
+
+
+def _sqlite_ranks(queryset: QuerySet, match: str) -> Dict[Any, float]:
+    """
+    Выполняет MATCH один раз и возвращает {id альбома: ранг} для лучших
+    SEARCH_MAX_RESULTS совпадений среди альбомов queryset.
+    """
+    candidates, params = queryset.order_by().values("pk").query.sql_with_params()
+    limit = getattr(settings, "SEARCH_MAX_RESULTS", SEARCH_MAX_RESULTS)
+    table = Album._meta.db_table
+    # bm25 тем меньше, чем релевантнее документ, поэтому берём со знаком минус
+    sql = (
+        f'SELECT "{table}"."id", -bm25({SQLITE_FTS_TABLE}) FROM {SQLITE_FTS_TABLE} '
+        f'JOIN "{table}" ON "{table}".rowid = {SQLITE_FTS_TABLE}.rowid '
+        f'WHERE {SQLITE_FTS_TABLE} MATCH %s AND "{table}"."id" IN ({candidates}) '
+        f"ORDER BY bm25({SQLITE_FTS_TABLE}) LIMIT %s"
+    )
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, [match, *params, limit])
+        return dict(cursor.fetchall())
+
+
+def search_backend(using: str = "default") -> str:
+    """Какой поиск используется для базы: sqlite-fts5, postgresql или icontains."""
+    vendor = connections[using].vendor
+    if vendor == "sqlite" and _sqlite_fts_available(using):
+        return "sqlite-fts5"
+    if vendor == "postgresql":
+        return "postgresql"
+    return "icontains"
+
+
+def search_albums(queryset: QuerySet, text: str) -> QuerySet:
+    """
+    Оставляет в queryset альбомы, подходящие под запрос, и добавляет search_rank
+    (чем больше, тем релевантнее). Сортировку вызывающий код выбирает сам,
+    например order_by("-search_rank").
+
+    В SQLite полнотекстовый запрос выполняется сразу, и в результат попадают
+    только SEARCH_MAX_RESULTS самых релевантных альбомов.
+    """
+    terms = search_terms(text)
+    if not terms:
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    backend = search_backend(queryset.db)
+    table = f'"{Album._meta.db_table}".'
+
+    if backend == "sqlite-fts5":
+        match = " ".join(f'"{term}"*' for term in terms)
+        # Коррелированный подзапрос с bm25 повторял бы MATCH для каждой строки
+        ranks = _sqlite_ranks(queryset, match)
+        rank = Case(
+            *[When(pk=pk, then=Value(value)) for pk, value in ranks.items()],
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+        return queryset.filter(pk__in=list(ranks)).annotate(search_rank=rank)
+
+    if backend == "postgresql":
+        tsquery = " & ".join(f"{term}:*" for term in terms)
+        document = POSTGRES_DOCUMENT.format(table=table)
+        matches = RawSQL(
+            f"{document} @@ to_tsquery('simple', %s)", (tsquery,), output_field=BooleanField()
+        )
+        rank = RawSQL(
+            f"ts_rank({document}, to_tsquery('simple', %s))", (tsquery,), output_field=FloatField()
+        )
+        return queryset.filter(matches).annotate(search_rank=rank)
+
+    condition = Q()
+    for term in terms:
+        condition &= Q(title__icontains=term) | Q(description__icontains=term)
+    return queryset.filter(condition).annotate(
+        search_rank=Value(0.0, output_field=FloatField())
+    )
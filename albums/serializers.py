@@ -1,7 +1,49 @@
+from typing import Any, Callable, Dict, Set
+
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
-from .models import Album, Photo, Collage, BugReport
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.urls import reverse
+from .models import Album, Photo, Collage, CollageJob, ExportJob, UploadSession, BugReport
+from .ingest import validate_photo_upload
+
+
+def parse_query_list(request: Any, name: str) -> Set[str]:
+    """Значения параметра вида ?name=a,b&name=c как множество."""
+    if request is None:
+        return set()
+    values = request.query_params.getlist(name)
+    return {item.strip() for value in values for item in value.split(",") if item.strip()}
+
+
+class SparseFieldsMixin:
+    """
+    Разреженные и расширенные ответы для GET-запросов.
+
+    ?fields=id,title — оставить только перечисленные поля;
+    ?expand=photos — добавить вложенные поля из expandable_fields.
+    """
+
+    expandable_fields: Dict[str, Callable[[], serializers.Field]] = {}
+    context: Any
+    fields: Any
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        request = self.context.get("request")
+        if request is None or request.method not in SAFE_METHODS:
+            return
+
+        expanded = parse_query_list(request, "expand") & set(self.expandable_fields)
+        for name in expanded:
+            self.fields[name] = self.expandable_fields[name]()
+
+        requested = parse_query_list(request, "fields")
+        if requested:
+            for name in set(self.fields) - requested - expanded:
+                self.fields.pop(name)
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -73,23 +115,37 @@ class ChangePasswordSerializer(serializers.Serializer):
 
 
 class PhotoSerializer(serializers.ModelSerializer):
+    srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = Photo
         fields = "__all__"
         read_only_fields = ("album",)
 
+    def get_srcset(self, obj):
+        """srcset с абсолютными URL, если в контексте есть запрос."""
+        request = self.context.get("request")
+        candidates = [(obj.thumbnail_small, 256), (obj.thumbnail_medium, 1024)]
+        return ", ".join(
+            f"{request.build_absolute_uri(field.url) if request else field.url} {width}w"
+            for field, width in candidates
+            if field
+        )
+
     def validate_image(self, value):
         """
         Проверка загружаемого изображения (Section 3.1).
         Business Logic Validation 3: Size and Format checks.
         """
-        limit_mb = 10
-        if value.size > limit_mb * 1024 * 1024:
-            raise serializers.ValidationError(f"Размер файла не может превышать {limit_mb} MB.")
-
         if not value.name.lower().endswith((".jpg", ".jpeg", ".png", ".webp")):
             raise serializers.ValidationError("Разрешены только форматы JPEG, PNG, WEBP.")
 
+        # Размер, сигнатура и заголовок — та же проверка, что и в конвейере загрузки
+        try:
+            validate_photo_upload(value)
+        except DjangoValidationError as e:
+            raise serializers.ValidationError(e.messages) from e
+
         return value
 
 
@@ -100,6 +156,9 @@ class BugReportSerializer(serializers.ModelSerializer):
         read_only_fields = (
             "user",
             "created_at",
+            "fingerprint",
+            "occurrences",
+            "last_seen_at",
         )
 
 
@@ -109,7 +168,120 @@ class CollageSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
-class AlbumSerializer(serializers.ModelSerializer):
+class CollageJobSerializer(serializers.ModelSerializer):
+    collage = CollageSerializer(read_only=True)
+
+    class Meta:
+        model = CollageJob
+        fields = (
+            "id",
+            "album",
+            "status",
+            "cell_size",
+            "output_format",
+            "collage",
+            "error",
+            "created_at",
+            "started_at",
+            "finished_at",
+        )
+        read_only_fields = fields
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    photo = PhotoSerializer(read_only=True)
+    upload_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = (
+            "id",
+            "album",
+            "filename",
+            "total_size",
+            "received_bytes",
+            "status",
+            "photo",
+            "error",
+            "upload_url",
+            "created_at",
+            "updated_at",
+        )
+        read_only_fields = fields
+
+    def get_upload_url(self, obj):
+        return reverse("album-upload-session", kwargs={"pk": obj.album_id, "session_id": obj.pk})
+
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    status_url = serializers.SerializerMethodField()
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ExportJob
+        fields = (
+            "id",
+            "kind",
+            "export_format",
+            "status",
+            "file_size",
+            "error",
+            "status_url",
+            "download_url",
+            "created_at",
+            "started_at",
+            "finished_at",
+            "expires_at",
+        )
+        read_only_fields = fields
+
+    def get_status_url(self, obj):
+        return reverse("exportjob-detail", kwargs={"pk": obj.pk})
+
+    def get_download_url(self, obj):
+        if obj.status != ExportJob.STATUS_DONE:
+            return None
+        return reverse("exportjob-download", kwargs={"pk": obj.pk})
+
+
+class AlbumSummarySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    Краткое представление альбома для списков: счётчики и обложка без вложенных
+    массивов. Ожидает queryset с annotate_album_summary().
+    """
+
+    photo_count = serializers.IntegerField(read_only=True)
+    collage_count = serializers.IntegerField(read_only=True)
+    cover_url = serializers.SerializerMethodField()
+
+    expandable_fields = {
+        "photos": lambda: PhotoSerializer(many=True, read_only=True),
+        "collages": lambda: CollageSerializer(many=True, read_only=True),
+    }
+
+    class Meta:
+        model = Album
+        fields = (
+            "id",
+            "user",
+            "title",
+            "description",
+            "is_public",
+            "created_at",
+            "updated_at",
+            "photo_count",
+            "collage_count",
+            "cover_url",
+        )
+        read_only_fields = fields
+
+    def get_cover_url(self, obj):
+        url = obj.cover_url
+        request = self.context.get("request")
+        return request.build_absolute_uri(url) if request and url else url or None
+
+
+class AlbumSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     photos = PhotoSerializer(many=True, read_only=True)
     collages = CollageSerializer(many=True, read_only=True)
 
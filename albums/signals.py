@@ -1,7 +1,10 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_migrate, post_save
 from django.contrib.auth.models import User
 from django.dispatch import receiver
-from .models import UserProfile
+from .models import ExportJob, UserProfile, Photo
+from .search import ensure_search_index
+from .utils import PHOTO_FILE_FIELDS, clear_collage_cache
 
 
 @receiver(post_save, sender=User)
@@ -13,3 +16,46 @@ def create_user_profile(sender, instance, created, **kwargs):
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
     instance.profile.save()
+
+
+@receiver(post_save, sender=Photo)
+@receiver(post_delete, sender=Photo)
+def invalidate_album_collages(sender, instance, **kwargs):
+    """Сбрасывает кэш коллажей альбома при любом изменении его фотографий."""
+    clear_collage_cache(instance.album_id)
+
+
+@receiver(post_delete, sender=Photo)
+def delete_unreferenced_photo_files(sender, instance, **kwargs):
+    """
+    Удаляет файлы фото из хранилища, когда на них больше не ссылается ни одна запись.
+
+    Одинаковые загрузки и копии альбомов разделяют файлы, поэтому файл удаляется
+    только после удаления последней ссылки и только после фиксации транзакции.
+    """
+    for field_name in PHOTO_FILE_FIELDS:
+        field_file = getattr(instance, field_name)
+        if not field_file.name:
+            continue
+        # Ссылки считаются только по имени в хранилище: у старых записей хэш бывает пустым
+        references = Photo.objects.filter(**{field_name: field_file.name}).exclude(pk=instance.pk)
+        if not references.exists():
+            transaction.on_commit(
+                lambda storage=field_file.storage, name=field_file.name: storage.delete(name)
+            )
+
+
+@receiver(post_delete, sender=ExportJob)
+def delete_export_file(sender, instance, **kwargs):
+    """Удаляет файл экспорта из хранилища после удаления задачи."""
+    if instance.file.name:
+        transaction.on_commit(
+            lambda storage=instance.file.storage, name=instance.file.name: storage.delete(name)
+        )
+
+
+@receiver(post_migrate)
+def restore_search_index(sender, using, **kwargs):
+    """Восстанавливает полнотекстовый индекс после миграций, пересоздавших albums_album."""
+    if sender.name == "albums":
+        ensure_search_index(using)
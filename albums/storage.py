@@ -0,0 +1,235 @@
+"""
+Хранилища медиафайлов.
+
+CachedStorage оборачивает удалённое хранилище (по умолчанию Cloudinary):
+запись и удаление уходят прямо в него, а открытые на чтение файлы
+сохраняются в DiskLRUCache. Повторное открытие того же файла (коллажи,
+скачивание) читает его с локального диска без обращения к сети.
+
+LocalCloudinaryStorage — офлайн-замена MediaCloudinaryStorage для разработки
+и бенчмарков: те же public ID и URL, но файлы лежат на локальном диске, а
+стоимость сети имитируется задержкой и ограничением скорости.
+"""
+
+import os
+import posixpath
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, Storage
+from django.utils.crypto import get_random_string
+from django.utils.deconstruct import deconstructible
+from django.utils.module_loading import import_string
+
+from .cache import DiskLRUCache
+
+MEDIA_CACHE_BACKEND = "cloudinary_storage.storage.MediaCloudinaryStorage"
+MEDIA_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+LOCAL_CLOUDINARY_URL = "/media/cloudinary/"
+LOCAL_CLOUDINARY_LATENCY = 0.08
+LOCAL_CLOUDINARY_BANDWIDTH = 5 * 1024 * 1024
+
+
+@deconstructible
+class CachedStorage(Storage):
+    """Read-through кэш оригиналов на локальном диске поверх другого хранилища."""
+
+    def __init__(
+        self,
+        backend: Optional[str] = None,
+        cache_dir: Optional[str] = None,
+        max_bytes: Optional[int] = None,
+        **backend_options: Any,
+    ):
+        backend_path = backend or getattr(settings, "MEDIA_CACHE_BACKEND", MEDIA_CACHE_BACKEND)
+        self.backend = import_string(backend_path)(**backend_options)
+        directory = cache_dir or getattr(settings, "MEDIA_CACHE_DIR", "")
+        self.cache = (
+            DiskLRUCache(
+                str(directory),
+                max_bytes or getattr(settings, "MEDIA_CACHE_MAX_BYTES", MEDIA_CACHE_MAX_BYTES),
+            )
+            if directory
+            else None
+        )
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _count(self, hit: bool) -> None:
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Счётчики попаданий и промахов кэша в текущем процессе."""
+        with self._stats_lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+            }
+
+    # Чтение: сначала локальный кэш, при промахе — скачивание в кэш
+
+    def _open(self, name: str, mode: str = "rb") -> File:
+        if self.cache is None or any(flag in mode for flag in "wa+"):
+            return self.backend.open(name, mode)
+
+        path = self.cache.get_path(name)
+        if path is not None:
+            try:
+                local = open(path, mode)
+            except FileNotFoundError:
+                # Запись вытеснил другой процесс между get_path и open
+                pass
+            else:
+                self._count(hit=True)
+                return File(local, name=name)
+
+        self._count(hit=False)
+        with self.backend.open(name, "rb") as remote:
+            path = self.cache.set_chunks(name, remote.chunks())
+        return File(open(path, mode), name=name)
+
+    # Запись и удаление проходят прямо в удалённое хранилище
+
+    def save(self, name: Optional[str], content: Any, max_length: Optional[int] = None) -> str:
+        name = self.backend.save(name, content, max_length=max_length)
+        if self.cache is not None:
+            self.cache.delete(name)
+        return name
+
+    def delete(self, name: str) -> None:
+        self.backend.delete(name)
+        if self.cache is not None:
+            self.cache.delete(name)
+
+    # Остальное делегируется удалённому хранилищу
+
+    def exists(self, name: str) -> bool:
+        return self.backend.exists(name)
+
+    def size(self, name: str) -> int:
+        return self.backend.size(name)
+
+    def url(self, name: Optional[str]) -> str:
+        return self.backend.url(name)
+
+    def path(self, name: str) -> str:
+        return self.backend.path(name)
+
+    def listdir(self, path: str) -> Any:
+        return self.backend.listdir(path)
+
+    def get_valid_name(self, name: str) -> str:
+        return self.backend.get_valid_name(name)
+
+    def get_available_name(self, name: str, max_length: Optional[int] = None) -> str:
+        return self.backend.get_available_name(name, max_length=max_length)
+
+    def generate_filename(self, filename: str) -> str:
+        return self.backend.generate_filename(filename)
+
+    def get_accessed_time(self, name: str) -> Any:
+        return self.backend.get_accessed_time(name)
+
+    def get_created_time(self, name: str) -> Any:
+        return self.backend.get_created_time(name)
+
+    def get_modified_time(self, name: str) -> Any:
+        return self.backend.get_modified_time(name)
+
+
+@deconstructible
+class LocalCloudinaryStorage(FileSystemStorage):
+    """
+    Ведёт себя как MediaCloudinaryStorage, но без сети.
+
+    Имя сохранённого файла — public ID в духе Cloudinary (папка, имя файла
+    со случайным суффиксом, без расширения), URL — вида
+    <base_url>image/upload/v1/<public_id>. Каждый запрос к «серверу» (открытие,
+    загрузка, удаление, exists, size) ждёт latency секунд плюс время передачи
+    байтов на скорости bandwidth (байт/с, 0 — без ограничения).
+    """
+
+    def __init__(
+        self,
+        location: Optional[str] = None,
+        base_url: Optional[str] = None,
+        latency: Optional[float] = None,
+        bandwidth: Optional[int] = None,
+    ):
+        super().__init__(
+            location=location or getattr(settings, "LOCAL_CLOUDINARY_ROOT", None),
+            base_url=base_url or getattr(settings, "LOCAL_CLOUDINARY_URL", LOCAL_CLOUDINARY_URL),
+        )
+        self.latency = (
+            latency
+            if latency is not None
+            else getattr(settings, "LOCAL_CLOUDINARY_LATENCY", LOCAL_CLOUDINARY_LATENCY)
+        )
+        self.bandwidth = (
+            bandwidth
+            if bandwidth is not None
+            else getattr(settings, "LOCAL_CLOUDINARY_BANDWIDTH", LOCAL_CLOUDINARY_BANDWIDTH)
+        )
+
+    def _network_delay(self, transferred: int = 0) -> None:
+        """Имитирует один запрос к Cloudinary с передачей transferred байт."""
+        delay = self.latency
+        if self.bandwidth and transferred:
+            delay += transferred / self.bandwidth
+        if delay > 0:
+            time.sleep(delay)
+
+    def _public_id(self, name: str) -> str:
+        # Как upload(use_filename=True, unique_filename=True): имя + суффикс, без расширения
+        name = name.replace("\\", "/")
+        folder, filename = posixpath.split(name)
+        stem = os.path.splitext(filename)[0] or "file"
+        return posixpath.join(folder, f"{stem}_{get_random_string(6).lower()}")
+
+    def get_available_name(self, name: str, max_length: Optional[int] = None) -> str:
+        # Уникальность обеспечивает суффикс public ID, как и в MediaCloudinaryStorage
+        return name if max_length is None else name[:max_length]
+
+    def _open(self, name: str, mode: str = "rb") -> File:
+        # Cloudinary отдаёт файл целиком одним HTTP-ответом
+        try:
+            with open(self.path(name), "rb") as f:
+                data = f.read()
+        except FileNotFoundError as e:
+            self._network_delay()
+            raise IOError(name) from e
+        self._network_delay(len(data))
+        file = ContentFile(data, name=name)
+        file.mode = mode
+        return file
+
+    def _save(self, name: str, content: Any) -> str:
+        self._network_delay(content.size)
+        return super()._save(self._public_id(name), content)
+
+    def delete(self, name: str) -> None:
+        self._network_delay()
+        super().delete(name)
+
+    def exists(self, name: str) -> bool:
+        self._network_delay()
+        return super().exists(name)
+
+    def size(self, name: str) -> int:
+        self._network_delay()
+        return super().size(name)
+
+    def url(self, name: Optional[str]) -> str:
+        return super().url(f"image/upload/v1/{name}")
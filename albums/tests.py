@@ -1,11 +1,86 @@
-from django.test import TestCase, Client
-from django.contrib.auth.models import User
+from django.test import TestCase, TransactionTestCase, Client, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from unittest import mock, skipUnless
+from django.utils import timezone
+from django.db import connection, models
+from django.core.management import call_command
+from django.contrib.auth.models import AnonymousUser, User
 from django.urls import reverse
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
 from rest_framework.test import APIClient
 from rest_framework import status
-from albums.models import Album, Photo, BugReport
+from albums.models import (
+    Album,
+    Photo,
+    BugReport,
+    Collage,
+    CollageJob,
+    ExportJob,
+    UploadSession,
+    UserProfile,
+)
+from albums.admin import AlbumResource
+from albums.cache import DiskLRUCache
+from albums.exports import (
+    claim_next_export_job,
+    cleanup_export_jobs,
+    request_export,
+    run_export_job,
+)
+from albums.bugreports import BugReportEvent, BugReportWriter, get_bug_report_writer
+from albums.middleware import AutomaticBugReportMiddleware
+from albums.uploads import (
+    UploadOffsetMismatch,
+    cleanup_upload_sessions,
+    get_upload_dir,
+    upload_session_path,
+    write_upload_chunk,
+)
+from albums.search import ensure_search_index, search_albums, search_backend
+from albums.storage import CachedStorage, LocalCloudinaryStorage
+from albums.ingest import ingest_photos, validate_image_header
+from albums.utils import PHOTO_FILE_FIELDS, create_collage_image, decode_image, get_collage_photos, iter_collage_cells
+from contextlib import redirect_stderr
+from io import BytesIO, StringIO
+import openpyxl
+from PIL import Image
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
 import uuid
+from datetime import timedelta
+
+
+def make_image_file(name="photo.jpg", color="red", size=(64, 64), image_format="JPEG"):
+    """Создаёт загружаемый файл с настоящим изображением."""
+    buffer = BytesIO()
+    Image.new("RGB", size, color).save(buffer, format=image_format)
+    return SimpleUploadedFile(name=name, content=buffer.getvalue(), content_type="image/jpeg")
+
+
+class MediaRootMixin:
+    """Изолирует загружаемые в тестах файлы во временной директории."""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.media_override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            COLLAGE_TILE_CACHE_DIR=os.path.join(self.media_root, "cache", "tiles"),
+            UPLOAD_SESSION_DIR=os.path.join(self.media_root, "uploads"),
+        )
+        self.media_override.enable()
+
+    def tearDown(self):
+        self.media_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        super().tearDown()
 
 
 class AlbumModelTest(TestCase):
@@ -61,6 +136,65 @@ class BugReportModelTest(TestCase):
         self.assertEqual(str(bug), "Bug: Test Bug (open)")
 
 
+class AutomaticBugReportTest(TestCase):
+    def setUp(self):
+        self.middleware = AutomaticBugReportMiddleware(lambda request: None)
+        self.factory = RequestFactory()
+
+    def raise_in_view(self, exc_type, message):
+        request = self.factory.get("/api/broken/")
+        request.user = AnonymousUser()
+        try:
+            raise exc_type(message)
+        except exc_type as e:
+            self.middleware.process_exception(request, e)
+
+    def report_exception(self, exc_type, message):
+        self.raise_in_view(exc_type, message)
+        get_bug_report_writer().flush()
+
+    def test_repeats_are_grouped_by_type_and_stack(self):
+        self.report_exception(ValueError, "photo 1 not found")
+        with self.assertNumQueries(1):
+            self.report_exception(ValueError, "photo 2 not found")
+        self.report_exception(KeyError, "photo")
+
+        grouped = BugReport.objects.get(title__contains="ValueError")
+        self.assertEqual(grouped.occurrences, 2)
+        self.assertIn("photo 1", grouped.title)
+        self.assertGreaterEqual(grouped.last_seen_at, grouped.created_at)
+        self.assertEqual(BugReport.objects.count(), 2)
+
+        # После закрытия повтор ошибки снова открывает отчёт
+        BugReport.objects.filter(pk=grouped.pk).update(status="closed")
+        self.report_exception(ValueError, "photo 3 not found")
+        self.assertEqual(BugReport.objects.filter(title__contains="ValueError").count(), 2)
+        self.assertEqual(BugReport.objects.get(status="open", title__contains="Value").occurrences, 1)
+
+    def test_error_path_only_queues_and_flush_batches_repeats(self):
+        with self.assertNumQueries(0):
+            for i in range(3):
+                self.raise_in_view(ValueError, f"photo {i} not found")
+        self.assertFalse(BugReport.objects.exists())
+
+        self.assertEqual(get_bug_report_writer().flush(), 3)
+        report = BugReport.objects.get()
+        self.assertEqual(report.occurrences, 3)
+        self.assertIn("in raise_in_view", report.description)
+        self.assertIn("ValueError: photo 0 not found", report.description)
+
+    def test_full_queue_drops_and_counts_reports(self):
+        writer = BugReportWriter(max_size=2, background=False)
+        request = self.factory.get("/api/broken/")
+        events = [BugReportEvent.capture(request, KeyError(i)) for i in range(3)]
+        self.assertEqual([writer.submit(event) for event in events], [True, True, False])
+        with redirect_stderr(StringIO()) as stderr:
+            writer.flush()
+        self.assertEqual(writer.stats(), {"queued": 0, "written": 2, "dropped": 1, "failed": 0})
+        self.assertIn("Dropped 1", stderr.getvalue())
+        self.assertEqual(BugReport.objects.get().occurrences, 2)
+
+
 class DashboardViewTest(TestCase):
     def setUp(self):
         self.client = Client()
@@ -78,6 +212,32 @@ class DashboardViewTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, "dashboard/index.html")
 
+    def test_dashboard_queries_do_not_grow_with_album_count(self):
+        def add_album(title, photos):
+            album = Album.objects.create(user=self.user, title=title)
+            for i in range(photos):
+                Photo.objects.create(
+                    album=album,
+                    image=f"photos/{title}_{i}.jpg",
+                    thumbnail_small=f"thumbs/{title}_{i}_256.webp",
+                )
+            return album
+
+        self.client.login(username="testuser", password="password123")
+        add_album("first", 2)
+        with CaptureQueriesContext(connection) as single:
+            self.client.get(self.dashboard_url)
+        for i in range(4):
+            add_album(f"more{i}", 3)
+        add_album("empty", 0)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(self.dashboard_url)
+
+        self.assertEqual(len(many), len(single))
+        self.assertContains(response, "/thumbs/more3_2_256.webp")
+        self.assertContains(response, "3 фото")
+        self.assertContains(response, "0 фото")
+
 
 class CreateAlbumViewTest(TestCase):
     def setUp(self):
@@ -134,3 +294,995 @@ class AlbumAPITest(TestCase):
         response = self.client.delete(url)
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertEqual(Album.objects.count(), 0)
+
+
+class CollageGenerationTest(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username="collageuser", password="password123")
+        self.album = Album.objects.create(user=self.user, title="Collage Album")
+        for color in ("red", "green", "blue", "yellow", "black"):
+            Photo.objects.create(album=self.album, image=make_image_file(f"{color}.png", color))
+
+    def test_parallel_cells_keep_photo_order(self):
+        photos = list(self.album.photos.all())
+        sequential = list(iter_collage_cells(photos, cell_size=16, workers=1))
+        parallel = list(iter_collage_cells(photos, cell_size=16, workers=4))
+        self.assertEqual(len(parallel), len(photos))
+        self.assertEqual(
+            [img.getpixel((8, 8)) for img in sequential],
+            [img.getpixel((8, 8)) for img in parallel],
+        )
+
+    def test_broken_photo_is_skipped(self):
+        Photo.objects.create(
+            album=self.album,
+            image=SimpleUploadedFile("broken.jpg", b"not an image", content_type="image/jpeg"),
+        )
+        cells = list(iter_collage_cells(list(self.album.photos.all()), cell_size=16, workers=4))
+        self.assertEqual(len(cells), 5)
+
+    @override_settings(COLLAGE_DECODE_WORKERS=1)
+    def test_sequential_mode_renders_collage(self):
+        collage_file = create_collage_image(self.album.photos.all(), cell_size=16)
+        self.assertIsNotNone(collage_file)
+        with Image.open(collage_file) as collage:
+            self.assertEqual(collage.size, (48, 32))
+
+    def test_cached_tiles_skip_storage(self):
+        photos = list(self.album.photos.all())
+        first = list(iter_collage_cells(photos, cell_size=16, workers=1))
+        for photo in photos:
+            photo.image.storage.delete(photo.image.name)
+        second = list(iter_collage_cells(photos, cell_size=16, workers=1))
+        self.assertEqual(
+            [img.getpixel((8, 8)) for img in first],
+            [img.getpixel((8, 8)) for img in second],
+        )
+
+    def test_strip_mode_matches_canvas_mode(self):
+        photos = self.album.photos.all()
+        canvas_file = create_collage_image(photos, cell_size=16, output_format="PNG")
+        strips_file = create_collage_image(
+            photos, cell_size=16, output_format="PNG", compose_mode="strips"
+        )
+        with Image.open(canvas_file) as canvas, Image.open(strips_file) as strips:
+            self.assertEqual(canvas.size, strips.size)
+            self.assertEqual(list(canvas.convert("RGB").getdata()), list(strips.convert("RGB").getdata()))
+
+
+class DiskLRUCacheTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = DiskLRUCache(self.directory, max_bytes=250)
+        cache.set("a", b"x" * 100)
+        cache.set("b", b"x" * 100)
+        # Отодвигаем "b" в прошлое и обращаемся к "a", чтобы порядок LRU был однозначным
+        old_path = cache.get_path("b")
+        os.utime(old_path, (0, 0))
+        self.assertIsNotNone(cache.get("a"))
+        cache.set("c", b"x" * 100)
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("c"))
+
+
+class CachedStorageTest(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.storage = CachedStorage(
+            backend="django.core.files.storage.FileSystemStorage",
+            cache_dir=os.path.join(self.media_root, "cache", "media"),
+            location=os.path.join(self.media_root, "remote"),
+        )
+
+    def read(self, name):
+        with self.storage.open(name) as f:
+            return f.read()
+
+    def test_reads_are_served_from_local_cache(self):
+        name = self.storage.save("photos/a.jpg", ContentFile(b"original bytes"))
+        self.assertEqual(self.read(name), b"original bytes")
+        # Второе чтение не обращается к удалённому хранилищу
+        with open(self.storage.backend.path(name), "wb") as remote:
+            remote.write(b"changed remotely")
+        self.assertEqual(self.read(name), b"original bytes")
+        self.assertEqual(self.storage.stats(), {"hits": 1, "misses": 1, "hit_ratio": 0.5})
+
+    def test_writes_and_deletes_invalidate_cache(self):
+        name = self.storage.save("photos/b.jpg", ContentFile(b"v1"))
+        self.read(name)
+        self.storage.delete(name)
+        self.assertFalse(self.storage.exists(name))
+        name = self.storage.save(name, ContentFile(b"v2"))
+        self.assertEqual(self.read(name), b"v2")
+        self.assertEqual(self.storage.misses, 2)
+
+
+class LocalCloudinaryStorageTest(MediaRootMixin, TestCase):
+    def test_mimics_public_ids_urls_and_network_cost(self):
+        storage = LocalCloudinaryStorage(
+            location=os.path.join(self.media_root, "cloudinary"),
+            base_url="/media/cloudinary/",
+            latency=0.01,
+            bandwidth=10_000,
+        )
+        started = time.monotonic()
+        name = storage.save("user_1/album_1/photos/beach.jpg", ContentFile(b"x" * 500))
+        self.assertGreaterEqual(time.monotonic() - started, 0.06)
+
+        self.assertRegex(name, r"^user_1/album_1/photos/beach_[a-z0-9]{6}$")
+        self.assertEqual(storage.url(name), f"/media/cloudinary/image/upload/v1/{name}")
+        with storage.open(name) as f:
+            self.assertEqual(f.read(), b"x" * 500)
+
+        storage.delete(name)
+        self.assertFalse(storage.exists(name))
+        with self.assertRaises(IOError):
+            storage.open(name)
+
+
+class DecodeImageTest(TestCase):
+    def test_jpeg_is_decoded_at_reduced_scale(self):
+        source = make_image_file(size=(1600, 1200))
+        img = decode_image(source, (300, 300))
+        self.assertEqual(img.size, (400, 300))
+
+    def test_exif_orientation_is_applied(self):
+        buffer = BytesIO()
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Повернуть на 90° по часовой стрелке
+        Image.new("RGB", (80, 40), "red").save(buffer, format="JPEG", exif=exif)
+        buffer.seek(0)
+        self.assertEqual(decode_image(buffer).size, (40, 80))
+
+    @override_settings(IMAGE_MAX_PIXELS=1000)
+    def test_decompression_bomb_is_rejected(self):
+        with self.assertRaises(Image.DecompressionBombError):
+            decode_image(make_image_file(size=(100, 100)))
+
+
+class CollageCacheTest(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username="cacheuser", password="password123")
+        self.album = Album.objects.create(user=self.user, title="Cached Album")
+        Photo.objects.create(album=self.album, image=make_image_file("a.jpg", "red"))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f"/api/albums/{self.album.id}/generate-collage/"
+
+    def test_repeated_request_reuses_collage(self):
+        first = self.client.post(self.url)
+        second = self.client.post(self.url)
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.data["id"], second.data["id"])
+        self.assertEqual(Collage.objects.filter(album=self.album).count(), 1)
+
+    def test_photo_change_invalidates_cache(self):
+        first = self.client.post(self.url)
+        Photo.objects.create(album=self.album, image=make_image_file("b.jpg", "blue"))
+        self.assertFalse(Collage.objects.get(pk=first.data["id"]).fingerprint)
+        second = self.client.post(self.url)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertNotEqual(first.data["id"], second.data["id"])
+
+    def test_web_view_reuses_collage(self):
+        web_client = Client()
+        web_client.force_login(self.user)
+        url = reverse("generate_collage", args=[self.album.id])
+        self.assertEqual(web_client.get(url).status_code, 200)
+        self.assertEqual(web_client.get(url).status_code, 200)
+        self.assertEqual(Collage.objects.filter(album=self.album).count(), 1)
+
+
+class CollageJobTest(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username="jobuser", password="password123")
+        self.album = Album.objects.create(user=self.user, title="Job Album")
+        Photo.objects.create(album=self.album, image=make_image_file("a.jpg", "red"))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_async_collage_is_rendered_by_worker(self):
+        response = self.client.post(
+            f"/api/albums/{self.album.id}/generate-collage/", {"async": True}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data["status"], CollageJob.STATUS_QUEUED)
+
+        call_command("run_worker", "--once", stdout=StringIO())
+
+        job_status = self.client.get(response.data["status_url"])
+        self.assertEqual(job_status.status_code, status.HTTP_200_OK)
+        self.assertEqual(job_status.data["status"], CollageJob.STATUS_DONE)
+        self.assertIsNotNone(job_status.data["collage"])
+
+    def test_job_of_empty_album_fails(self):
+        empty_album = Album.objects.create(user=self.user, title="Empty")
+        job = CollageJob.objects.create(album=empty_album, user=self.user)
+        call_command("run_worker", "--once", stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, CollageJob.STATUS_FAILED)
+        self.assertTrue(job.error)
+
+
+class PhotoThumbnailTest(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username="thumbuser", password="password123")
+        self.album = Album.objects.create(user=self.user, title="Thumb Album")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_upload_creates_thumbnails(self):
+        response = self.client.post(
+            f"/api/albums/{self.album.id}/upload-photos/",
+            {"images": [make_image_file("big.jpg", size=(2000, 1000))]},
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        photo = self.album.photos.get()
+        with Image.open(photo.thumbnail_small) as small:
+            self.assertEqual(small.size, (256, 128))
+        with Image.open(photo.thumbnail_medium) as medium:
+            self.assertEqual(medium.size, (1024, 512))
+        self.assertIn("256w", photo.srcset)
+        self.assertIn("1024w", photo.srcset)
+
+    def test_album_page_uses_thumbnails(self):
+        self.client.post(
+            f"/api/albums/{self.album.id}/upload-photos/",
+            {"images": [make_image_file("a.jpg")]},
+            format="multipart",
+        )
+        photo = self.album.photos.get()
+        web_client = Client()
+        web_client.force_login(self.user)
+        response = web_client.get(reverse("album_detail", args=[self.album.id]))
+        self.assertContains(response, photo.thumbnail_small.url)
+        self.assertNotContains(response, f'src="{photo.image.url}"')
+
+
+class PhotoMetadataTest(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username="metauser", password="password123")
+        self.album = Album.objects.create(user=self.user, title="Meta Album")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_upload_persists_metadata(self):
+        upload = make_image_file("meta.png", size=(120, 80), image_format="PNG")
+        content = upload.read()
+        upload.seek(0)
+        self.client.post(
+            f"/api/albums/{self.album.id}/upload-photos/", {"images": [upload]}, format="multipart"
+        )
+        photo = self.album.photos.get()
+        self.assertEqual((photo.width, photo.height), (120, 80))
+        self.assertEqual(photo.file_size, len(content))
+        self.assertEqual(photo.mime_type, "image/png")
+        self.assertEqual(photo.content_hash, hashlib.sha256(content).hexdigest())
+
+    def test_stats_sum_stored_sizes(self):
+        for name in ("a.jpg", "b.jpg"):
+            self.client.post(
+                f"/api/albums/{self.album.id}/upload-photos/",
+                {"images": [make_image_file(name)]},
+                format="multipart",
+            )
+        expected = sum(self.album.photos.values_list("file_size", flat=True))
+        response = self.client.get("/api/albums/user_albums_stats/")
+        self.assertEqual(response.data["total_photos"], 2)
+        self.assertEqual(response.data["total_size"], expected)
+
+
+class PhotoDeduplicationTest(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username="dedupuser", password="password123")
+        self.first_album = Album.objects.create(user=self.user, title="First")
+        self.second_album = Album.objects.create(user=self.user, title="Second")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, album, upload):
+        return self.client.post(
+            f"/api/albums/{album.id}/upload-photos/", {"images": [upload]}, format="multipart"
+        )
+
+    def test_identical_upload_reuses_stored_file(self):
+        self.upload(self.first_album, make_image_file("roll.jpg", "red"))
+        self.upload(self.second_album, make_image_file("roll_copy.jpg", "red"))
+        first = self.first_album.photos.get()
+        second = self.second_album.photos.get()
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(first.thumbnail_small.name, second.thumbnail_small.name)
+        self.assertEqual(first.content_hash, second.content_hash)
+
+    def test_shared_file_is_deleted_with_last_reference(self):
+        self.upload(self.first_album, make_image_file("roll.jpg", "red"))
+        self.upload(self.second_album, make_image_file("roll.jpg", "red"))
+        first = self.first_album.photos.get()
+        storage = first.image.storage
+        name = first.image.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.second_album.photos.get().delete()
+        self.assertFalse(storage.exists(name))
+
+    def test_file_shared_with_unhashed_row_is_kept(self):
+        self.upload(self.first_album, make_image_file("roll.jpg", "red"))
+        first = self.first_album.photos.get()
+        # Старая запись без хэша (например, бэкфилл для неё не сработал)
+        Photo.objects.create(album=self.second_album, image=first.image.name, content_hash="")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(first.image.storage.exists(first.image.name))
+
+
+@override_settings(PHOTO_MAX_UPLOAD_SIZE=20 * 1024)
+class PhotoIngestTest(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username="ingestuser", password="password123")
+        self.album = Album.objects.create(user=self.user, title="Ingest Album")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_batch_reports_per_file_results(self):
+        noise = BytesIO()
+        Image.frombytes("RGB", (200, 200), os.urandom(200 * 200 * 3)).save(noise, format="PNG")
+        too_big = SimpleUploadedFile("noise.png", noise.getvalue(), content_type="image/png")
+        response = self.client.post(
+            f"/api/albums/{self.album.id}/upload-photos/",
+            {
+                "images": [
+                    make_image_file("a.jpg", "red"),
+                    make_image_file("a_copy.jpg", "red"),
+                    too_big,
+                    make_image_file("b.jpg", "blue"),
+                ]
+            },
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            [result["status"] for result in response.data["results"]],
+            ["created", "duplicate", "rejected", "created"],
+        )
+        self.assertEqual(response.data["count"], 3)
+        self.assertEqual(self.album.photos.count(), 3)
+        self.assertEqual(Photo.history.filter(album=self.album).count(), 3)
+
+    def test_insert_queries_do_not_grow_with_batch_size(self):
+        images = [make_image_file(f"{i}.jpg", (i * 40, 0, 0)) for i in range(6)]
+        url = f"/api/albums/{self.album.id}/upload-photos/"
+        with self.assertNumQueries(8):
+            self.client.post(url, {"images": images}, format="multipart")
+        self.assertEqual(self.album.photos.count(), 6)
+
+    def test_web_form_rejects_whole_batch(self):
+        noise = BytesIO()
+        Image.frombytes("RGB", (200, 200), os.urandom(200 * 200 * 3)).save(noise, format="PNG")
+        web_client = Client()
+        web_client.force_login(self.user)
+        response = web_client.post(
+            reverse("add_photos", args=[self.album.id]),
+            {"photos": [make_image_file("ok.jpg"), SimpleUploadedFile("big.png", noise.getvalue())]},
+        )
+        self.assertTemplateUsed(response, "pages/upload_error.html")
+        self.assertFalse(self.album.photos.exists())
+
+    def test_storage_names_are_computed_outside_upload_pool(self):
+        threads = []
+
+        def record_thread(upload_to):
+            def wrapper(instance, filename):
+                threads.append(threading.current_thread().name)
+                return upload_to(instance, filename)
+
+            return wrapper
+
+        # Свежий альбом: album.user ещё не загружен
+        album = Album.objects.get(pk=self.album.pk)
+        patches = [
+            mock.patch.object(field, "upload_to", record_thread(field.upload_to))
+            for field in (Photo._meta.get_field(name) for name in PHOTO_FILE_FIELDS)
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        images = [make_image_file(f"{i}.jpg", (i * 40, 0, 0)) for i in range(3)]
+        results = ingest_photos(album, images)
+
+        self.assertEqual([result.status for result in results], ["created"] * 3)
+        self.assertTrue(threads)
+        self.assertEqual(set(threads), {threading.current_thread().name})
+
+
+class ImageHeaderValidationTest(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username="headeruser", password="password123")
+        self.album = Album.objects.create(user=self.user, title="Headers")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_header_reports_real_format_and_size(self):
+        renamed = make_image_file("photo.jpg", image_format="PNG")
+        self.assertEqual(validate_image_header(renamed), ("PNG", 64, 64))
+        self.assertEqual(renamed.tell(), 0)
+
+    def test_rejects_non_images_corrupt_files_and_bombs(self):
+        cases = [
+            SimpleUploadedFile("notes.jpg", b"just some text pretending to be a photo"),
+            SimpleUploadedFile("corrupt.jpg", b"\xff\xd8\xff" + os.urandom(64)),
+        ]
+        with override_settings(IMAGE_MAX_PIXELS=1000):
+            cases.append(make_image_file("bomb.jpg"))
+            for image_file in cases:
+                with self.subTest(image_file.name), self.assertRaises(ValidationError):
+                    validate_image_header(image_file)
+
+            response = self.client.post(
+                f"/api/albums/{self.album.id}/upload-photos/",
+                {"images": cases},
+                format="multipart",
+            )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            [result["status"] for result in response.data["results"]], ["rejected"] * 3
+        )
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, f"user_{self.user.id}")))
+
+
+@override_settings(PHOTO_INGEST_MAX_EDGE=100, PHOTO_INGEST_FORMAT="JPEG")
+class PhotoReencodeTest(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username="reencoder", password="password123")
+        self.album = Album.objects.create(user=self.user, title="Phone photos")
+        # Снимок с телефона: шум (плохо сжимается), EXIF-поворот на 90°
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        buffer = BytesIO()
+        Image.frombytes("RGB", (400, 200), os.urandom(400 * 200 * 3)).save(
+            buffer, format="JPEG", quality=95, exif=exif
+        )
+        self.content = buffer.getvalue()
+
+    def upload(self):
+        image_file = SimpleUploadedFile("phone.jpg", self.content, content_type="image/jpeg")
+        return ingest_photos(self.album, [image_file])[0].photo
+
+    def test_oversized_original_is_downscaled_and_stripped(self):
+        photo = self.upload()
+        self.assertEqual((photo.width, photo.height), (50, 100))
+        self.assertLess(photo.file_size, len(self.content))
+        with Image.open(photo.image.path) as stored:
+            self.assertEqual(stored.size, (50, 100))
+            self.assertNotIn(0x0112, stored.getexif())
+
+    def test_owner_can_keep_originals(self):
+        UserProfile.objects.filter(user=self.user).update(keep_original_photos=True)
+        photo = self.upload()
+        self.assertEqual(photo.content_hash, hashlib.sha256(self.content).hexdigest())
+        self.assertEqual((photo.width, photo.height), (200, 400))
+
+
+class AlbumListRepresentationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="lister", password="password123")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.add_album("Album 0", photos=2)
+
+    def add_album(self, title, photos):
+        album = Album.objects.create(user=self.user, title=title)
+        for i in range(photos):
+            Photo.objects.create(album=album, image=f"photos/{title}_{i}.jpg")
+        Collage.objects.create(album=album, image=f"collages/{title}.jpg")
+        return album
+
+    def test_list_is_summary_without_nested_arrays(self):
+        response = self.client.get("/api/albums/")
+        album = response.data["results"][0]
+        self.assertNotIn("photos", album)
+        self.assertEqual((album["photo_count"], album["collage_count"]), (2, 1))
+        self.assertTrue(album["cover_url"].endswith("/photos/Album%200_1.jpg"))
+
+        detail = self.client.get(f"/api/albums/{album['id']}/")
+        self.assertEqual(len(detail.data["photos"]), 2)
+
+    def test_sparse_fields(self):
+        response = self.client.get("/api/albums/", {"fields": "id,title"})
+        self.assertEqual(set(response.data["results"][0]), {"id", "title"})
+
+    def test_expanded_list_uses_constant_queries(self):
+        url = "/api/albums/?expand=photos,collages"
+        with CaptureQueriesContext(connection) as single:
+            self.client.get(url)
+        for i in range(1, 5):
+            self.add_album(f"Album {i}", photos=3)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url)
+
+        self.assertEqual(len(many), len(single))
+        self.assertEqual(sum(len(album["photos"]) for album in response.data["results"]), 14)
+
+
+class PhotoKeysetPaginationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="pager", password="password123")
+        self.album = Album.objects.create(user=self.user, title="Many photos")
+        for i in range(25):
+            Photo.objects.create(album=self.album, image=f"photos/{i}.jpg")
+        # Одинаковое время у части фото: порядок среди них задаёт id
+        tied = Photo.objects.order_by("pk").values_list("pk", flat=True)[5:12]
+        Photo.objects.filter(pk__in=list(tied)).update(created_at=timezone.now())
+        self.expected = list(
+            Photo.objects.order_by("-created_at", "-pk").values_list("pk", flat=True)
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append(response.data)
+            url = response.data["next"]
+        return pages
+
+    def test_cursor_pages_cover_all_photos_in_order(self):
+        for url in (
+            "/api/photos/?pagination=cursor",
+            f"/api/albums/{self.album.id}/photos/?pagination=cursor",
+            "/api/photos/complex_filter/?pagination=cursor",
+        ):
+            with self.subTest(url):
+                pages = self.walk(url)
+                self.assertEqual([len(page["results"]) for page in pages], [10, 10, 5])
+                self.assertEqual(
+                    [photo["id"] for page in pages for photo in page["results"]], self.expected
+                )
+
+    def test_previous_cursor_returns_previous_page(self):
+        pages = self.walk("/api/photos/?pagination=cursor")
+        self.assertIsNone(pages[0]["previous"])
+        previous = self.client.get(pages[2]["previous"]).data
+        self.assertEqual(previous["results"], pages[1]["results"])
+        self.assertEqual(self.client.get(previous["next"]).data["results"], pages[2]["results"])
+
+    def test_deep_page_skips_count_and_offset(self):
+        last_page = self.walk("/api/photos/?pagination=cursor")[-1]
+        cursor_url = self.client.get("/api/photos/?pagination=cursor&page_size=20").data["next"]
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(cursor_url)
+        sql = " ".join(query["sql"] for query in queries).upper()
+        self.assertNotIn("COUNT(", sql)
+        self.assertNotIn("OFFSET", sql)
+        self.assertEqual(len(last_page["results"]), 5)
+        self.assertEqual(self.client.get("/api/photos/?cursor=garbage").status_code, 404)
+
+
+@skipUnless(connection.vendor == "sqlite", "план запроса проверяется по формату EXPLAIN QUERY PLAN SQLite")
+class QueryIndexTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="planner", password="password123")
+        self.album = Album.objects.create(user=self.user, title="Indexed")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, plan)
+        for line in plan.splitlines():
+            # SCAN без USING INDEX — полный перебор таблицы
+            self.assertFalse("SCAN" in line and "USING" not in line, plan)
+        self.assertNotIn("TEMP B-TREE", plan, plan)
+
+    def explain_queries(self, queries):
+        plans = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                cursor.execute(f"EXPLAIN QUERY PLAN {query['sql']}")
+                plans.append("\n".join(str(row[-1]) for row in cursor.fetchall()))
+        return plans
+
+    def test_hot_queries_use_composite_indexes(self):
+        cases = [
+            (self.album.photos.all(), "photo_album_created_idx"),
+            (
+                Photo.objects.filter(album=self.album).order_by("-created_at", "-pk")[:21],
+                "photo_album_created_idx",
+            ),
+            # validate_title и duplicate_album проверяют .exists(), без сортировки
+            (Album.objects.filter(user=self.user, title="Indexed").order_by(), "album_user_title_idx"),
+            (Album.objects.filter(user=self.user), "album_user_created_idx"),
+        ]
+        for queryset, index_name in cases:
+            with self.subTest(index_name):
+                self.assertUsesIndex(queryset, index_name)
+
+    def test_collage_photo_queries_use_indexes(self):
+        Photo.objects.create(album=self.album, image="all.jpg")
+        with CaptureQueriesContext(connection) as queries:
+            photos = list(get_collage_photos(self.album))
+        self.assertEqual(len(photos), 1)
+        # Проверка избранных и выборка всех фото альбома
+        exists_plan, photos_plan = self.explain_queries(queries)
+        self.assertIn("photo_album_fav_idx", exists_plan, exists_plan)
+        self.assertIn("photo_album_created_idx", photos_plan, photos_plan)
+
+        Photo.objects.create(album=self.album, image="best.jpg", is_favorite=True)
+        with CaptureQueriesContext(connection) as queries:
+            photos = list(get_collage_photos(self.album))
+        self.assertEqual([photo.image.name for photo in photos], ["best.jpg"])
+        for plan in self.explain_queries(queries):
+            self.assertIn("photo_album_fav_idx", plan, plan)
+            self.assertNotIn("TEMP B-TREE", plan, plan)
+
+    def test_advanced_search_uses_index_per_branch(self):
+        Album.objects.create(user=self.user, title="Public", description="x", is_public=True)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/albums/advanced_search/", {"query": "Pub"})
+        self.assertEqual([album["title"] for album in response.data], ["Public"])
+
+        query = next(q for q in queries if 'FROM "albums_album"' in q["sql"])
+        (plan,) = self.explain_queries([query])
+        # Ветка владельца и ветка публичных альбомов — каждая по своему индексу
+        self.assertRegex(plan, r"USING (COVERING )?INDEX \w+ \(user_id=\?\)", plan)
+        self.assertIn("album_public_created_idx", plan, plan)
+        self.assertNotRegex(plan, r"SCAN albums_album\b(?! USING)", plan)
+
+
+class AlbumSearchTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="seeker", password="password123")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def search(self, text):
+        return list(search_albums(Album.objects.all(), text).values_list("title", flat=True))
+
+    def test_index_follows_create_update_and_delete(self):
+        album = Album.objects.create(user=self.user, title="Летний отпуск", description="Море и горы")
+        self.assertEqual(self.search("ЛЕТН"), ["Летний отпуск"])
+        self.assertEqual(self.search("море гор"), ["Летний отпуск"])
+        self.assertEqual(self.search("море зима"), [])
+
+        album.title = "Зимний отпуск"
+        album.save()
+        self.assertEqual(self.search("летний"), [])
+        self.assertEqual(self.search("зимн"), ["Зимний отпуск"])
+
+        album.delete()
+        self.assertEqual(self.search("отпуск"), [])
+
+    def test_results_are_ranked_and_operators_are_ignored(self):
+        Album.objects.create(user=self.user, title="Notes", description="one cat here")
+        Album.objects.create(user=self.user, title="Cat cat", description="cat photos")
+        ranked = search_albums(Album.objects.all(), 'cat*" (').order_by("-search_rank")
+        self.assertEqual([album.title for album in ranked], ["Cat cat", "Notes"])
+
+        response = self.client.get("/api/albums/advanced_search/", {"query": "cat"})
+        self.assertEqual([album["title"] for album in response.data], ["Cat cat", "Notes"])
+
+    @skipUnless(connection.vendor == "sqlite", "FTS5 есть только в SQLite")
+    def test_sqlite_search_uses_fts_index(self):
+        self.assertEqual(search_backend(), "sqlite-fts5")
+        for i in range(3):
+            Album.objects.create(user=self.user, title=f"cat {i}")
+        with CaptureQueriesContext(connection) as queries:
+            ranked = list(search_albums(Album.objects.all(), "cat").order_by("-search_rank"))
+        self.assertEqual(len(ranked), 3)
+        # MATCH выполняется один раз на запрос, а не для каждой найденной строки
+        matches = [q["sql"] for q in queries if "MATCH" in q["sql"]]
+        self.assertEqual(len(matches), 1)
+        self.assertEqual(sum(sql.count("MATCH") for sql in matches), 1)
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN SELECT rowid FROM albums_album_fts WHERE albums_album_fts MATCH 'cat*'")
+            plan = "\n".join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn("VIRTUAL TABLE", plan, plan)
+
+    @skipUnless(connection.vendor == "sqlite", "FTS5 есть только в SQLite")
+    def test_index_rows_are_found_by_rowid(self):
+        Album.objects.create(user=self.user, title="Rowid")
+        with connection.cursor() as cursor:
+            for trigger in ("albums_album_fts_ad", "albums_album_fts_au"):
+                cursor.execute("SELECT sql FROM sqlite_master WHERE name = %s", [trigger])
+                self.assertIn("WHERE rowid = old.rowid", cursor.fetchone()[0])
+            cursor.execute(
+                "SELECT count(*) FROM albums_album JOIN albums_album_fts "
+                "ON albums_album_fts.rowid = albums_album.rowid"
+            )
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+
+@skipUnless(connection.vendor == "sqlite", "Пересоздание таблиц при изменении схемы есть только в SQLite")
+class AlbumSearchSchemaChangeTest(TransactionTestCase):
+    def test_index_survives_table_remake(self):
+        user = User.objects.create_user(username="remake", password="password123")
+        Album.objects.create(user=user, title="Zebra crossing")
+        field = models.IntegerField(default=0)
+        field.set_attributes_from_name("remake_probe")
+        try:
+            # Как любая миграция, меняющая Album: SQLite копирует таблицу и теряет триггеры
+            with connection.schema_editor() as editor:
+                editor.add_field(Album, field)
+            with connection.schema_editor() as editor:
+                editor.remove_field(Album, field)
+        finally:
+            self.assertTrue(ensure_search_index())
+        self.assertFalse(ensure_search_index())
+
+        Album.objects.create(user=user, title="Zebra stripes")
+        titles = search_albums(Album.objects.all(), "zebra").values_list("title", flat=True)
+        self.assertEqual(sorted(titles), ["Zebra crossing", "Zebra stripes"])
+
+
+class AlbumExportTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="exporter", password="password123")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def export(self):
+        response = self.client.get("/api/albums/export-excel/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        workbook = openpyxl.load_workbook(BytesIO(b"".join(response.streaming_content)))
+        return list(workbook["Albums Export"].iter_rows(values_only=True))
+
+    def test_export_queries_do_not_grow_with_album_count(self):
+        album = Album.objects.create(user=self.user, title="Full")
+        for i in range(3):
+            Photo.objects.create(album=album, image=f"p{i}.jpg", file_size=1024)
+        with CaptureQueriesContext(connection) as small:
+            rows = self.export()
+        self.assertEqual(rows[1][:2], ("Full", "3"))
+        self.assertEqual(rows[1][6], "Мало фото")
+
+        for i in range(10):
+            Album.objects.create(user=self.user, title=f"Empty {i}")
+        with CaptureQueriesContext(connection) as large:
+            rows = self.export()
+        self.assertEqual(len(rows), 12)
+        self.assertEqual(len(large), len(small))
+
+    def test_admin_resource_export_counts_photos_in_one_query(self):
+        album = Album.objects.create(user=self.user, title="Full")
+        for i in range(3):
+            Photo.objects.create(album=album, image=f"p{i}.jpg")
+        for i in range(5):
+            Album.objects.create(user=self.user, title=f"Empty {i}")
+        with self.assertNumQueries(1):
+            dataset = AlbumResource().export(Album.objects.all())
+        self.assertEqual(len(dataset), 6)
+        self.assertEqual(dataset.dict[-1]["photo_count"], 3)
+        self.assertEqual(dataset.dict[-1]["user__username"], "exporter")
+
+    def test_csv_and_ndjson_are_streamed(self):
+        Album.objects.create(user=self.user, title="Отпуск, 2024")
+        response = self.client.get("/api/albums/export-excel/", {"format": "csv"})
+        self.assertTrue(response.streaming)
+        self.assertIn(".csv", response["Content-Disposition"])
+        lines = b"".join(response.streaming_content).decode("utf-8-sig").splitlines()
+        self.assertEqual(lines[0].split(",")[:2], ["Название", "Кол-во фото"])
+        self.assertTrue(lines[1].startswith('"Отпуск, 2024",0,'))
+
+        response = self.client.get("/api/albums/export-excel/", {"format": "ndjson"})
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        records = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual(records[0]["Название"], "Отпуск, 2024")
+        self.assertEqual(records[0]["Заполненность"], "Пустой")
+
+    def test_bug_report_export_formats(self):
+        BugReport.objects.create(user=self.user, title="Crash", description="trace")
+        self.assertEqual(
+            self.client.get("/api/bug-reports/export-excel/", {"format": "csv"}).status_code,
+            status.HTTP_403_FORBIDDEN,
+        )
+        admin_user = User.objects.create_superuser(username="root", password="password123")
+        self.client.force_authenticate(admin_user)
+        response = self.client.get("/api/bug-reports/export-excel/", {"format": "ndjson"})
+        record = json.loads(b"".join(response.streaming_content))
+        self.assertEqual((record["User"], record["Title"]), ("exporter", "Crash"))
+
+        web_client = Client()
+        web_client.force_login(admin_user)
+        response = web_client.post(
+            reverse("admin:albums_bugreport_changelist"),
+            {"action": "export_to_csv", "_selected_action": BugReport.objects.values_list("pk", flat=True)},
+        )
+        self.assertIn(b"Crash", b"".join(response.streaming_content))
+
+
+class ExportJobTest(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username="deferred", password="password123")
+        Album.objects.create(user=self.user, title="Later")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def request_export(self):
+        return self.client.get("/api/albums/export-excel/", {"format": "csv", "async": "1"})
+
+    def test_export_runs_in_worker_and_is_reused_within_ttl(self):
+        queued = self.request_export()
+        self.assertEqual(queued.status_code, status.HTTP_202_ACCEPTED)
+        self.assertIsNone(queued.data["download_url"])
+        self.assertEqual(self.request_export().data["id"], queued.data["id"])
+        self.assertEqual(self.client.get(queued.data["status_url"]).data["status"], "queued")
+
+        call_command("run_worker", "--once", stdout=StringIO())
+
+        done = self.request_export()
+        self.assertEqual(done.status_code, status.HTTP_200_OK)
+        self.assertEqual((done.data["id"], done.data["status"]), (queued.data["id"], "done"))
+        download = self.client.get(done.data["download_url"])
+        self.assertIn(".csv", download["Content-Disposition"])
+        self.assertIn("Later", b"".join(download.streaming_content).decode("utf-8-sig"))
+
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user(username="stranger", password="x"))
+        self.assertEqual(other.get(done.data["download_url"]).status_code, 404)
+
+    def test_expired_exports_are_cleaned_up(self):
+        job, _ = request_export(self.user, "albums", "ndjson")
+        run_export_job(claim_next_export_job())
+        job.refresh_from_db()
+        path = job.file.path
+        self.assertTrue(os.path.exists(path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(cleanup_export_jobs(job.expires_at - timedelta(seconds=1)), 0)
+            self.assertEqual(cleanup_export_jobs(job.expires_at + timedelta(seconds=1)), 1)
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(ExportJob.objects.exists())
+        self.assertNotEqual(request_export(self.user, "albums", "ndjson")[0].pk, job.pk)
+
+
+class ResumableUploadTest(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username="chunker", password="password")
+        self.album = Album.objects.create(user=self.user, title="Chunked")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.content = make_image_file("big.png", color="purple", image_format="PNG").read()
+        self.sessions_url = reverse("album-upload-sessions", kwargs={"pk": self.album.pk})
+
+    def start(self, key="upload-1"):
+        return self.client.post(
+            self.sessions_url,
+            {"filename": "big.png", "size": len(self.content)},
+            format="json",
+            HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def put_chunk(self, url, offset, data):
+        return self.client.put(
+            url, data=data, content_type="application/offset+octet-stream", HTTP_UPLOAD_OFFSET=str(offset)
+        )
+
+    def test_chunked_upload_resumes_and_completes_once(self):
+        response = self.start()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        upload_url = response.data["upload_url"]
+        middle = len(self.content) // 2
+
+        self.assertEqual(self.put_chunk(upload_url, 0, self.content[:middle]).status_code, 200)
+        # Повтор уже принятой части: сервер сообщает, откуда продолжать
+        conflict = self.put_chunk(upload_url, 0, self.content[:middle])
+        self.assertEqual(conflict.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(conflict.data["received_bytes"], middle)
+
+        response = self.put_chunk(upload_url, middle, self.content[middle:])
+        self.assertEqual(response.data["received_bytes"], len(self.content))
+
+        complete_url = reverse(
+            "album-upload-session-complete",
+            kwargs={"pk": self.album.pk, "session_id": response.data["id"]},
+        )
+        first = self.client.post(complete_url)
+        second = self.client.post(complete_url)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.data["status"], UploadSession.STATUS_COMPLETE)
+        self.assertEqual(second.data["photo"]["id"], first.data["photo"]["id"])
+        self.assertEqual(self.album.photos.count(), 1)
+
+        photo = self.album.photos.get()
+        self.assertEqual(photo.content_hash, hashlib.sha256(self.content).hexdigest())
+        self.assertFalse(os.listdir(os.path.join(self.media_root, "uploads")))
+
+    def test_idempotency_key_returns_existing_session(self):
+        first = self.start()
+        retry = self.start()
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.data["id"], first.data["id"])
+        self.assertEqual(UploadSession.objects.count(), 1)
+
+    def test_complete_rejects_incomplete_upload(self):
+        response = self.start()
+        self.put_chunk(response.data["upload_url"], 0, self.content[:10])
+        complete_url = reverse(
+            "album-upload-session-complete",
+            kwargs={"pk": self.album.pk, "session_id": response.data["id"]},
+        )
+        self.assertEqual(self.client.post(complete_url).status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(self.album.photos.exists())
+
+    def test_concurrent_retry_of_same_chunk_does_not_touch_spool(self):
+        session = UploadSession.objects.get(pk=self.start().data["id"])
+        winner = self.content[:100]
+
+        class RacingStream(BytesIO):
+            # Пока этот запрос читает тело, параллельный повтор успевает записать ту же часть
+            def read(self, size=-1):
+                if not getattr(self, "raced", False):
+                    self.raced = True
+                    write_upload_chunk(session, 0, BytesIO(winner), len(winner))
+                return super().read(size)
+
+        with self.assertRaises(UploadOffsetMismatch) as raised:
+            write_upload_chunk(session, 0, RacingStream(b"x" * 50), 50)
+        self.assertEqual(raised.exception.offset, len(winner))
+        with open(upload_session_path(session), "rb") as spool:
+            self.assertEqual(spool.read(), winner)
+        session.refresh_from_db()
+        self.assertEqual(
+            (session.status, session.received_bytes), (UploadSession.STATUS_ACTIVE, len(winner))
+        )
+
+    def test_completed_session_survives_cleanup_for_retries(self):
+        response = self.start()
+        self.put_chunk(response.data["upload_url"], 0, self.content)
+        complete_url = reverse(
+            "album-upload-session-complete",
+            kwargs={"pk": self.album.pk, "session_id": response.data["id"]},
+        )
+        photo_id = self.client.post(complete_url).data["photo"]["id"]
+
+        cleanup_upload_sessions(timezone.now() + timedelta(days=2))
+        retry = self.start()
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.data["id"], response.data["id"])
+        self.assertEqual(self.client.post(complete_url).data["photo"]["id"], photo_id)
+        self.assertEqual(self.album.photos.count(), 1)
+
+    def test_cleanup_removes_expired_and_orphaned_spool_files(self):
+        session = UploadSession.objects.get(pk=self.start().data["id"])
+        self.put_chunk(self.start().data["upload_url"], 0, self.content[:10])
+        # Файлы сессий, созданных другим процессом и уже удалённых из БД
+        stale_orphan = os.path.join(get_upload_dir(), f"{uuid.uuid4()}.part")
+        fresh_orphan = os.path.join(get_upload_dir(), f"{uuid.uuid4()}.part")
+        for path in (stale_orphan, fresh_orphan):
+            open(path, "wb").close()
+        day_ago = time.time() - 2 * 24 * 60 * 60
+        os.utime(stale_orphan, (day_ago, day_ago))
+
+        self.assertEqual(cleanup_upload_sessions(), 0)
+        self.assertTrue(os.path.exists(upload_session_path(session)))
+        self.assertFalse(os.path.exists(stale_orphan))
+        self.assertTrue(os.path.exists(fresh_orphan))
+
+        self.assertEqual(cleanup_upload_sessions(timezone.now() + timedelta(days=2)), 1)
+        self.assertFalse(os.path.exists(upload_session_path(session)))
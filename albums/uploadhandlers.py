@@ -0,0 +1,45 @@
+"""
+Обработчики загрузки файлов, считающие SHA-256 по мере получения данных.
+
+Хэш вычисляется по тем же чанкам, которые Django пишет в память или во
+временный файл, поэтому для дедупликации файл не нужно перечитывать.
+Готовый хэш доступен как атрибут `content_hash` загруженного файла.
+"""
+
+import hashlib
+
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+
+
+class HashingUploadMixin:
+    """Добавляет к обработчику загрузки подсчёт SHA-256 содержимого файла."""
+
+    def new_file(self, *args, **kwargs):
+        # До вызова super(): MemoryFileUploadHandler завершает new_file исключением StopFutureHandlers
+        self.content_hash = hashlib.sha256()
+        super().new_file(*args, **kwargs)  # type: ignore[misc]
+
+    def is_storing(self) -> bool:
+        """Сохраняет ли этот обработчик текущий файл (а не передаёт чанки дальше)."""
+        return True
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.is_storing():
+            self.content_hash.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)  # type: ignore[misc]
+
+    def file_complete(self, file_size):
+        uploaded_file = super().file_complete(file_size)  # type: ignore[misc]
+        if uploaded_file is not None:
+            uploaded_file.content_hash = self.content_hash.hexdigest()
+        return uploaded_file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    def is_storing(self) -> bool:
+        # Большие файлы этот обработчик пропускает во временный файл
+        return self.activated
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    pass
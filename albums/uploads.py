@@ -0,0 +1,232 @@
+"""
+Возобновляемая загрузка фотографий по частям.
+
+Протокол:
+
+1. клиент открывает сессию (имя и размер файла, необязательный ключ
+   идемпотентности) — повтор с тем же ключом возвращает ту же сессию;
+2. части отправляются PUT-запросами с заголовком Upload-Offset и сразу
+   дописываются во временный файл на диске, в памяти не накапливаются;
+   после обрыва клиент запрашивает сессию и продолжает с received_bytes;
+3. завершение передаёт собранный файл в общий конвейер (albums.ingest).
+   Повторное завершение возвращает уже созданное фото.
+"""
+
+import os
+import shutil
+import tempfile
+import uuid
+from datetime import timedelta
+from typing import Any, BinaryIO, Optional, Tuple
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .ingest import ingest_photos, validate_upload_size
+from .models import UploadSession
+
+UPLOAD_CHUNK_MAX_SIZE = 8 * 1024 * 1024  # 8 MB
+UPLOAD_SESSION_TTL = 24 * 60 * 60
+UPLOAD_COPY_BUFFER = 64 * 1024
+
+
+class UploadOffsetMismatch(Exception):
+    """Часть прислана не с того смещения, с которого сервер ожидает продолжение."""
+
+    def __init__(self, offset: int):
+        super().__init__(f"Expected offset {offset}")
+        self.offset = offset
+
+
+def get_upload_dir() -> str:
+    # Каталог должен быть общим для web и воркера, иначе воркер не удалит файлы сессий
+    directory = getattr(settings, "UPLOAD_SESSION_DIR", None) or os.path.join(
+        settings.BASE_DIR, "var", "uploads"
+    )
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def upload_session_path(session: UploadSession) -> str:
+    return os.path.join(get_upload_dir(), f"{session.pk}.part")
+
+
+def _remove_spool_file(session: UploadSession) -> None:
+    try:
+        os.remove(upload_session_path(session))
+    except FileNotFoundError:
+        pass
+
+
+def start_upload_session(
+    album: Any, user: Any, filename: str, total_size: int, idempotency_key: str = ""
+) -> Tuple[UploadSession, bool]:
+    """Открывает сессию загрузки или возвращает уже открытую с тем же ключом."""
+    if idempotency_key:
+        existing = UploadSession.objects.filter(user=user, idempotency_key=idempotency_key).first()
+        if existing is not None:
+            if existing.album_id != album.pk or existing.total_size != total_size:
+                raise ValidationError("Ключ идемпотентности уже использован для другого файла.")
+            return existing, False
+
+    validate_upload_size(total_size)
+    try:
+        with transaction.atomic():
+            session = UploadSession.objects.create(
+                album=album,
+                user=user,
+                idempotency_key=idempotency_key,
+                filename=os.path.basename(filename),
+                total_size=total_size,
+            )
+    except IntegrityError:
+        # Параллельный запрос с тем же ключом успел создать сессию
+        return UploadSession.objects.get(user=user, idempotency_key=idempotency_key), False
+
+    open(upload_session_path(session), "wb").close()
+    return session, True
+
+
+def write_upload_chunk(
+    session: UploadSession, offset: int, stream: BinaryIO, length: int
+) -> UploadSession:
+    """
+    Дописывает часть файла из потока запроса в файл сессии.
+
+    Если соединение оборвалось посреди части, полученные байты сохраняются:
+    клиент продолжит с нового значения received_bytes.
+
+    Тело сначала читается во временный файл запроса. Затем условный UPDATE
+    переводит сессию в writing, и только выигравший запрос переносит байты
+    в файл сессии: параллельный повтор той же части не трогает файл.
+    """
+    if session.status != UploadSession.STATUS_ACTIVE:
+        raise ValidationError("Сессия загрузки уже завершена.")
+    if offset != session.received_bytes:
+        raise UploadOffsetMismatch(session.received_bytes)
+    max_chunk = getattr(settings, "UPLOAD_CHUNK_MAX_SIZE", UPLOAD_CHUNK_MAX_SIZE)
+    if length > max_chunk:
+        raise ValidationError(f"Размер части не может превышать {max_chunk} байт.")
+    if offset + length > session.total_size:
+        raise ValidationError("Часть выходит за пределы объявленного размера файла.")
+
+    with tempfile.TemporaryFile(dir=get_upload_dir()) as chunk:
+        written = 0
+        while written < length:
+            block = stream.read(min(UPLOAD_COPY_BUFFER, length - written))
+            if not block:
+                break
+            chunk.write(block)
+            written += len(block)
+
+        # Из двух одновременных повторов одной части смещение получает один
+        claimed = UploadSession.objects.filter(
+            pk=session.pk, status=UploadSession.STATUS_ACTIVE, received_bytes=offset
+        ).update(status=UploadSession.STATUS_WRITING, updated_at=timezone.now())
+        if not claimed:
+            session.refresh_from_db()
+            raise UploadOffsetMismatch(session.received_bytes)
+
+        received = offset
+        try:
+            chunk.seek(0)
+            with open(upload_session_path(session), "r+b") as spool:
+                spool.seek(offset)
+                shutil.copyfileobj(chunk, spool, UPLOAD_COPY_BUFFER)
+                spool.truncate(offset + written)
+            received = offset + written
+        finally:
+            UploadSession.objects.filter(
+                pk=session.pk, status=UploadSession.STATUS_WRITING
+            ).update(
+                status=UploadSession.STATUS_ACTIVE,
+                received_bytes=received,
+                updated_at=timezone.now(),
+            )
+    session.refresh_from_db()
+    return session
+
+
+def complete_upload_session(session: UploadSession) -> UploadSession:
+    """Передаёт собранный файл в конвейер загрузки; повторный вызов ничего не меняет."""
+    if session.received_bytes != session.total_size:
+        raise ValidationError(
+            f"Получено {session.received_bytes} из {session.total_size} байт."
+        )
+
+    claimed = UploadSession.objects.filter(
+        pk=session.pk, status=UploadSession.STATUS_ACTIVE
+    ).update(status=UploadSession.STATUS_PROCESSING, updated_at=timezone.now())
+    if not claimed:
+        # Сессию уже завершил этот или параллельный запрос
+        session.refresh_from_db()
+        if session.status == UploadSession.STATUS_WRITING:
+            raise ValidationError("Часть файла ещё записывается.")
+        return session
+
+    try:
+        with open(upload_session_path(session), "rb") as spool:
+            result = ingest_photos(session.album, [File(spool, name=session.filename)])[0]
+        if result.ok:
+            session.photo = result.photo
+            session.status = UploadSession.STATUS_COMPLETE
+        else:
+            session.status = UploadSession.STATUS_FAILED
+            session.error = result.error
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        session.status = UploadSession.STATUS_FAILED
+        session.error = str(e)
+
+    session.save(update_fields=["photo", "status", "error", "updated_at"])
+    _remove_spool_file(session)
+    return session
+
+
+def cleanup_upload_sessions(now: Optional[Any] = None) -> int:
+    """
+    Удаляет незавершённые и неудачные сессии старше UPLOAD_SESSION_TTL вместе
+    с их временными файлами, а также старые временные файлы без сессии.
+
+    Завершённые сессии остаются: повтор с тем же ключом идемпотентности
+    должен вернуть уже созданное фото, а не загрузить его второй раз.
+    """
+    ttl = getattr(settings, "UPLOAD_SESSION_TTL", UPLOAD_SESSION_TTL)
+    deadline = (now or timezone.now()) - timedelta(seconds=ttl)
+    unfinished = [
+        UploadSession.STATUS_ACTIVE,
+        # Запрос с частью файла оборвался между захватом смещения и его записью
+        UploadSession.STATUS_WRITING,
+        UploadSession.STATUS_FAILED,
+    ]
+    expired = list(UploadSession.objects.filter(status__in=unfinished, updated_at__lt=deadline))
+    for session in expired:
+        _remove_spool_file(session)
+    if expired:
+        UploadSession.objects.filter(pk__in=[s.pk for s in expired]).delete()
+    _remove_orphan_spool_files(deadline.timestamp())
+    return len(expired)
+
+
+def _remove_orphan_spool_files(older_than: float) -> None:
+    directory = get_upload_dir()
+    stale = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.name.endswith(".part") or entry.stat().st_mtime >= older_than:
+                continue
+            try:
+                stale[uuid.UUID(entry.name[: -len(".part")])] = entry.path
+            except ValueError:
+                continue
+    if not stale:
+        return
+    alive = set(UploadSession.objects.filter(pk__in=list(stale)).values_list("pk", flat=True))
+    for session_id, path in stale.items():
+        if session_id not in alive:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
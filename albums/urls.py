@@ -1,11 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import AlbumViewSet, PhotoViewSet, BugReportViewSet
+from .views import AlbumViewSet, PhotoViewSet, BugReportViewSet, ExportJobViewSet
 
 router = DefaultRouter()
 router.register(r'albums', AlbumViewSet, basename='album')
 router.register(r'photos', PhotoViewSet, basename='photo')
 router.register(r'bug-reports', BugReportViewSet, basename='bugreport')
+router.register(r'export-jobs', ExportJobViewSet, basename='exportjob')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -1,17 +1,19 @@
+import os
 import uuid
 import json
 from typing import Any, cast
 
-from django.db.models import Q
+from django.db.models import Count, Q, Sum
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth import login
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.utils.decorators import method_decorator
 from django.utils import timezone
 from django.views.generic import ListView
-from django.http import JsonResponse, HttpResponseForbidden, HttpResponse, HttpRequest
+from django.http import FileResponse, JsonResponse, HttpResponseForbidden, HttpResponse, HttpRequest
 from django.urls import reverse
 from django_filters.rest_framework import DjangoFilterBackend
 
@@ -23,18 +25,69 @@ from rest_framework.views import APIView
 from rest_framework.authtoken.models import Token
 
 
-from .models import Album, Photo, Collage, BugReport, UserProfile
+from .models import Album, Photo, CollageJob, ExportJob, UploadSession, BugReport, UserProfile
 from .forms import StyledUserCreationForm, UserForm, ProfileForm
+from .exports import EXPORT_CONTENT_TYPES, EXPORT_REPORTS, export_download_name, request_export
+from .ingest import collect_upload_errors, ingest_photos
+from .pagination import PhotoPagination
+from .renderers import EXPORT_RENDERERS, requested_export_format
+from .search import search_albums
+from .uploads import (
+    UploadOffsetMismatch,
+    complete_upload_session,
+    start_upload_session,
+    write_upload_chunk,
+)
 from .serializers import (
     AlbumSerializer,
+    AlbumSummarySerializer,
     PhotoSerializer,
     CollageSerializer,
+    CollageJobSerializer,
+    ExportJobSerializer,
+    UploadSessionSerializer,
     UserSerializer,
     UserProfileSerializer,
     ChangePasswordSerializer,
     BugReportSerializer,
+    parse_query_list,
+)
+from .utils import (
+    annotate_album_summary,
+    copy_photo_files,
+    export_queryset,
+    get_collage_photos,
+    get_or_create_collage,
+    is_truthy,
 )
-from .utils import create_collage_image, export_queryset_to_excel
+
+
+def export_report(request, kind: str):
+    """
+    Отдаёт отчёт из albums.exports.EXPORT_REPORTS в формате, выбранном по ?format=.
+
+    С ?async=1 файл собирает фоновый воркер: в ответе задача экспорта
+    (202, или 200, если такой же экспорт уже готов и не просрочен).
+    """
+    export_format = requested_export_format(request)
+    if is_truthy(request.query_params.get("async")):
+        job, _ = request_export(request.user, kind, export_format)
+        return Response(
+            ExportJobSerializer(job).data,
+            status=status.HTTP_200_OK
+            if job.status == ExportJob.STATUS_DONE
+            else status.HTTP_202_ACCEPTED,
+        )
+
+    report = EXPORT_REPORTS[kind]
+    return export_queryset(
+        queryset=report.queryset(request.user, {}),
+        headers=report.headers,
+        row_extractor=report.row,
+        sheet_title=report.sheet_title,
+        filename_prefix=report.filename_prefix,
+        export_format=export_format,
+    )
 
 
 class UserOwnedMixin:
@@ -139,6 +192,27 @@ class AlbumViewSet(UserOwnedMixin, viewsets.ModelViewSet):
     search_fields = ["title", "description"]
     ordering_fields = ["created_at", "title", "updated_at"]
 
+    # Списки отдают краткое представление; вложенные массивы — только по ?expand=
+    summary_actions = ("list", "advanced_search")
+
+    def get_serializer_class(self):
+        if self.action in self.summary_actions:
+            return AlbumSummarySerializer
+        return AlbumSerializer
+
+    def with_read_annotations(self, queryset):
+        """Счётчики, обложка и предвыборка вложенных полей, которые попадут в ответ."""
+        if self.action in self.summary_actions:
+            nested = parse_query_list(self.request, "expand") & {"photos", "collages"}
+        elif self.action == "retrieve":
+            nested = {"photos", "collages"}
+        else:
+            return queryset
+        return annotate_album_summary(queryset).prefetch_related(*sorted(nested))
+
+    def get_queryset(self):
+        return self.with_read_annotations(super().get_queryset())
+
     @action(detail=False, methods=["get"])
     def advanced_search(self, request):
         """
@@ -150,18 +224,22 @@ class AlbumViewSet(UserOwnedMixin, viewsets.ModelViewSet):
         mode = request.query_params.get("mode", "all")
 
         # Base: User's albums OR Public albums
-        # (user=me) | (is_public=True)
-        base_condition = Q(user=request.user) | Q(is_public=True)
+        # (user=me) | (is_public=True). Ветки OR выбираются через UNION, чтобы каждая
+        # шла по своему индексу (по user и частичный album_public_created_idx):
+        # для OR по разным колонкам планировщик иногда выбирает полный перебор таблицы
+        visible = (
+            Album.objects.filter(user=request.user)
+            .order_by()
+            .values("pk")
+            .union(Album.objects.filter(is_public=True).order_by().values("pk"))
+        )
+        base_condition = Q(pk__in=visible)
 
         if query:
             # Complex logic:
-            # (Title contains query OR Description contains query) AND NOT (Title="Untitled")
-            text_condition = (Q(title__icontains=query) | Q(description__icontains=query)) & ~Q(
-                title__iexact="Untitled"
-            )
-
-            # Combine: Base AND Text
-            final_query = base_condition & text_condition
+            # (Title/Description match query) AND NOT (Title="Untitled").
+            # Совпадение по тексту ищется полнотекстовым индексом (albums/search.py)
+            final_query = base_condition & ~Q(title__iexact="Untitled")
         else:
             final_query = base_condition
 
@@ -171,6 +249,9 @@ class AlbumViewSet(UserOwnedMixin, viewsets.ModelViewSet):
             final_query = final_query & ~Q(is_public=True)
 
         albums = Album.objects.filter(final_query).distinct()
+        if query:
+            albums = search_albums(albums, query).order_by("-search_rank", "-created_at")
+        albums = self.with_read_annotations(albums)
         serializer = self.get_serializer(albums, many=True)
         return Response(serializer.data)
 
@@ -179,12 +260,14 @@ class AlbumViewSet(UserOwnedMixin, viewsets.ModelViewSet):
         """Статистика альбомов пользователя (Section 9.1)."""
         albums = self.get_queryset()
         total_albums = albums.count()
-        # Mocking size because we don't store individual photo sizes in DB perfectly aligned with reqs
-        total_photos = Photo.objects.filter(album__in=albums).count()
+        photo_stats = Photo.objects.filter(album__in=albums).aggregate(
+            total_photos=Count("id"), total_size=Sum("file_size")
+        )
         return Response(
             {
                 "total_albums": total_albums,
-                "total_photos": total_photos,
+                "total_photos": photo_stats["total_photos"],
+                "total_size": photo_stats["total_size"] or 0,
                 "message": "Stats retrieved",
             }
         )
@@ -225,10 +308,9 @@ class AlbumViewSet(UserOwnedMixin, viewsets.ModelViewSet):
         )
         # Copy photos
         for photo in original.photos.all():  # type: ignore
+            # Using same file references: files are reference-counted on delete
             Photo.objects.create(
-                album=new_album,
-                image=photo.image,  # Using same file reference
-                is_favorite=photo.is_favorite,
+                album=new_album, **copy_photo_files(photo, is_favorite=photo.is_favorite)
             )
         serializer = self.get_serializer(new_album)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -257,88 +339,26 @@ class AlbumViewSet(UserOwnedMixin, viewsets.ModelViewSet):
         """Поделиться альбомом (Section 2)."""
         return Response({"status": "Shared"})
 
-    @action(detail=False, methods=["get"], url_path="export-excel")
+    @action(
+        detail=False, methods=["get"], url_path="export-excel", renderer_classes=EXPORT_RENDERERS
+    )
     def export_excel(self, request):
-        """Экспорт списка альбомов в Excel (Section 6, 7)."""
-        headers = [
-            "Название",
-            "Кол-во фото",
-            "Дата создания",
-            "Шаблон",
-            "Статус",
-            "Размер",
-            "Заполненность",
-            "Тип",
-            "Рейтинг",
-            "Активность",
-        ]
-
-        def dehydrate_album_size(obj):
-            # Section 7.1
-            # We assume photo size if we could track it. Mocking simple size logic.
-            # In real world we would sum file sizes.
-            return "15.5 МБ"
-
-        def dehydrate_completion_status(obj):
-            # Section 7.2
-            photo_count = obj.photos.count()  # type: ignore
-            if photo_count == 0:
-                return "Пустой"
-            elif photo_count < 10:
-                return "Мало фото"
-            else:
-                return "Заполнен"
-
-        def dehydrate_template_type(obj):
-            # Section 7.3
-            # Assuming layout_template exists or mocking it
-            layout = getattr(obj, "layout_template", "standard")
-            colors = {"wedding": "💒", "travel": "✈️", "portrait": "👤", "family": "👪"}
-            return f"{colors.get(layout, '📁')} {layout}"
-
-        def dehydrate_album_rating(obj):
-            # Section 7.4
-            views = getattr(obj, "views_count", 0)
-            if views > 1000:
-                return "Популярный"
-            elif views > 100:
-                return "Средний"
-            else:
-                return "Новый"
-
-        def dehydrate_recent_activity(obj):
-            # Section 7.5
-            if not obj.updated_at:
-                return "Неактивный"
-            days_ago = (timezone.now() - obj.updated_at).days
-            if days_ago == 0:
-                return "Сегодня"
-            elif days_ago <= 7:
-                return f"{days_ago} дней назад"
-            else:
-                return "Неактивный"
-
-        def extract_row(album):
-            return [
-                album.title,
-                str(album.photos.count()),  # type: ignore
-                album.created_at.strftime("%Y-%m-%d"),
-                "Standard",  # Mock template
-                "Draft",  # Mock status
-                dehydrate_album_size(album),
-                dehydrate_completion_status(album),
-                dehydrate_template_type(album),
-                dehydrate_album_rating(album),
-                dehydrate_recent_activity(album),
-            ]
-
-        return export_queryset_to_excel(
-            queryset=self.get_queryset(),
-            headers=headers,
-            row_extractor=extract_row,
-            sheet_title="Albums Export",
-            filename_prefix="my_albums",
+        """
+        Экспорт списка альбомов в Excel (Section 6, 7); ?format=csv|ndjson — потоково,
+        ?async=1 — через фоновую задачу (ответ 202 со ссылкой на статус).
+        """
+        return export_report(request, "albums")
+
+    @action(detail=True, methods=["get"])
+    def photos(self, request, pk=None):
+        """Фото альбома постранично; ?pagination=cursor включает keyset-пагинацию."""
+        album = self.get_object()
+        paginator = PhotoPagination()
+        page = paginator.paginate_queryset(
+            album.photos.order_by("-created_at", "-pk"), request, view=self
         )
+        serializer = PhotoSerializer(page, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
 
     @action(detail=True, methods=["post"], url_path="upload-photos")
     def upload_photos(self, request, pk=None):
@@ -348,16 +368,107 @@ class AlbumViewSet(UserOwnedMixin, viewsets.ModelViewSet):
         if not images:
             return Response({"error": "No images provided"}, status=status.HTTP_400_BAD_REQUEST)
 
-        created_photos = []
-        for image in images:
-            photo = Photo.objects.create(album=album, image=image)
-            created_photos.append(photo)
+        results = ingest_photos(album, images)
+        created_count = sum(1 for result in results if result.ok)
 
         return Response(
-            {"status": "Photos uploaded", "count": len(created_photos)},
-            status=status.HTTP_201_CREATED,
+            {
+                "status": "Photos uploaded" if created_count else "No photos uploaded",
+                "count": created_count,
+                "results": [result.as_dict() for result in results],
+            },
+            status=status.HTTP_201_CREATED if created_count else status.HTTP_400_BAD_REQUEST,
         )
 
+    @action(detail=True, methods=["post"], url_path="upload-sessions", url_name="upload-sessions")
+    def upload_sessions(self, request, pk=None):
+        """Открывает возобновляемую загрузку одного файла (заголовок Idempotency-Key необязателен)."""
+        album = self.get_object()
+        filename = request.data.get("filename")
+        try:
+            total_size = int(request.data.get("size"))
+        except (TypeError, ValueError):
+            total_size = -1
+        if not filename or total_size <= 0:
+            return Response(
+                {"error": "filename and size are required"}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        idempotency_key = request.headers.get(
+            "Idempotency-Key", request.data.get("idempotency_key", "")
+        )[:255]
+        try:
+            session, created = start_upload_session(
+                album, request.user, filename, total_size, idempotency_key
+            )
+        except DjangoValidationError as e:
+            return Response({"error": " ".join(e.messages)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(
+            UploadSessionSerializer(session, context={"request": request}).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
+    def _get_upload_session(self, request, session_id):
+        album = self.get_object()
+        return get_object_or_404(UploadSession, pk=session_id, album=album, user=request.user)
+
+    @action(
+        detail=True,
+        methods=["get", "put"],
+        url_path=r"upload-sessions/(?P<session_id>[0-9a-f-]{36})",
+        url_name="upload-session",
+    )
+    def upload_session(self, request, pk=None, session_id=None):
+        """
+        GET — состояние сессии (с какого смещения продолжать).
+        PUT — очередная часть файла в теле запроса, смещение в заголовке Upload-Offset.
+        """
+        session = self._get_upload_session(request, session_id)
+        if request.method == "PUT":
+            try:
+                offset = int(request.headers.get("Upload-Offset", ""))
+                length = int(request.headers.get("Content-Length") or 0)
+            except ValueError:
+                return Response(
+                    {"error": "Upload-Offset header is required"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            try:
+                # Тело читается из потока запроса напрямую, без разбора парсерами DRF
+                session = write_upload_chunk(session, offset, request.stream, length)
+            except UploadOffsetMismatch as e:
+                return Response(
+                    {"error": str(e), "received_bytes": e.offset},
+                    status=status.HTTP_409_CONFLICT,
+                )
+            except DjangoValidationError as e:
+                return Response(
+                    {"error": " ".join(e.messages)}, status=status.HTTP_400_BAD_REQUEST
+                )
+        return Response(UploadSessionSerializer(session, context={"request": request}).data)
+
+    @action(
+        detail=True,
+        methods=["post"],
+        url_path=r"upload-sessions/(?P<session_id>[0-9a-f-]{36})/complete",
+        url_name="upload-session-complete",
+    )
+    def complete_upload(self, request, pk=None, session_id=None):
+        """Завершает загрузку: собранный файл проходит общий конвейер и становится фото."""
+        session = self._get_upload_session(request, session_id)
+        try:
+            session = complete_upload_session(session)
+        except DjangoValidationError as e:
+            return Response({"error": " ".join(e.messages)}, status=status.HTTP_409_CONFLICT)
+
+        data = UploadSessionSerializer(session, context={"request": request}).data
+        if session.status == UploadSession.STATUS_FAILED:
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
+        if session.status == UploadSession.STATUS_PROCESSING:
+            return Response(data, status=status.HTTP_202_ACCEPTED)
+        return Response(data)
+
     @action(detail=True, methods=["post"], url_path="generate-collage")
     def generate_collage(self, request, pk=None):
         album = self.get_object()
@@ -366,15 +477,8 @@ class AlbumViewSet(UserOwnedMixin, viewsets.ModelViewSet):
         # We look for photos marked as favorite first
         # use_best = request.data.get("use_best_shots", False)  # Optional flag from frontend
 
-        photos = album.photos.all()  # type: ignore
-
-        # If user explicitly wants best shots, or just as a default logic if we decide:
-        # Let's say if we have favorites, we use them. If not, we use all.
-        favorites = photos.filter(is_favorite=True)
-        if favorites.exists():
-            photos_to_use = favorites
-        else:
-            photos_to_use = photos
+        # If we have favorites, we use them. If not, we use all.
+        photos_to_use = get_collage_photos(album)
 
         if not photos_to_use.exists():
             return Response(
@@ -382,30 +486,57 @@ class AlbumViewSet(UserOwnedMixin, viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        collage_file = create_collage_image(photos_to_use)
+        # Асинхронный режим: коллаж соберёт фоновый воркер (manage.py run_worker)
+        if is_truthy(request.data.get("async", request.query_params.get("async"))):
+            job = CollageJob.objects.create(album=album, user=request.user)
+            return Response(
+                {
+                    "job_id": job.id,
+                    "status": job.status,
+                    "status_url": reverse(
+                        "album-collage-job", kwargs={"pk": album.pk, "job_id": job.id}
+                    ),
+                },
+                status=status.HTTP_202_ACCEPTED,
+            )
+
+        # Повторный запрос с тем же набором фото отдаёт уже готовый коллаж
+        collage, created = get_or_create_collage(album, photos_to_use)
 
-        if collage_file:
-            collage = Collage(album=album)
-            collage.image.save(f"collage_{uuid.uuid4()}.jpg", collage_file)
+        if collage:
             serializer = CollageSerializer(collage)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            return Response(
+                serializer.data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+            )
         else:
             return Response(
                 {"error": "Failed to generate collage"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
 
+    @action(
+        detail=True,
+        methods=["get"],
+        url_path=r"collage-jobs/(?P<job_id>[0-9a-f-]{36})",
+        url_name="collage-job",
+    )
+    def collage_job(self, request, pk=None, job_id=None):
+        """Статус фоновой генерации коллажа: queued, running, done или failed."""
+        album = self.get_object()
+        job = get_object_or_404(CollageJob.objects.select_related("collage"), pk=job_id, album=album)
+        return Response(CollageJobSerializer(job).data)
+
 
 class PhotoViewSet(UserOwnedMixin, viewsets.ModelViewSet):
     """Управление фотографиями (удаление, просмотр, пометка избранным)."""
 
     queryset = Photo.objects.all()
     serializer_class = PhotoSerializer
-    pagination_class = PageNumberPagination
+    pagination_class = PhotoPagination
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ["album", "created_at", "is_favorite"]
-    ordering_fields = ["created_at", "file_size"]  # file_size mock
+    ordering_fields = ["created_at", "file_size", "width", "height"]
     user_field = "album__user"  # Переопределяем поле фильтрации
 
     @action(detail=False, methods=["get"])
@@ -466,14 +597,21 @@ class PhotoViewSet(UserOwnedMixin, viewsets.ModelViewSet):
 
 
 class BugReportViewSet(UserOwnedMixin, viewsets.ModelViewSet):
-    queryset = BugReport.objects.all()
+    """
+    Баг-репорты. Повторы одной ошибки сгруппированы в один отчёт
+    (occurrences, last_seen_at); сначала — недавно повторявшиеся.
+    """
+
+    # Отчёты одинакового «возраста» упорядочены по id, чтобы страницы не перемешивались
+    queryset = BugReport.objects.order_by("-last_seen_at", "-id")
     serializer_class = BugReportSerializer
     permission_classes = [permissions.IsAuthenticated]
+    filterset_fields = ["status"]
 
     def get_queryset(self):
         # Админ видит все, пользователь — только свои
         if self.request.user.is_staff:
-            return BugReport.objects.all()
+            return self.queryset.select_related("user")
         return super().get_queryset()
 
     @action(
@@ -481,27 +619,36 @@ class BugReportViewSet(UserOwnedMixin, viewsets.ModelViewSet):
         methods=["get"],
         permission_classes=[permissions.IsAdminUser],
         url_path="export-excel",
+        renderer_classes=EXPORT_RENDERERS,
     )
     def export_excel(self, request):
-        """Экспорт баг-репортов в Excel (только для админа)."""
-        headers = ["ID", "User", "Title", "Description", "Status", "Created At"]
-
-        def extract_row(report):
-            return [
-                str(report.id),
-                report.user.username,
-                report.title,
-                report.description,
-                report.status,
-                report.created_at.strftime("%Y-%m-%d %H:%M:%S"),
-            ]
-
-        return export_queryset_to_excel(
-            queryset=BugReport.objects.all(),
-            headers=headers,
-            row_extractor=extract_row,
-            sheet_title="Bug Reports",
-            filename_prefix="bug_reports",
+        """Экспорт баг-репортов в Excel или ?format=csv|ndjson, ?async=1 (только для админа)."""
+        return export_report(request, "bug_reports")
+
+
+class ExportJobViewSet(UserOwnedMixin, viewsets.ReadOnlyModelViewSet):
+    """Задачи отложенного экспорта пользователя: статус и скачивание файла."""
+
+    queryset = ExportJob.objects.all()
+    serializer_class = ExportJobSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    @action(detail=True, methods=["get"])
+    def download(self, request, pk=None):
+        """Готовый файл экспорта; 409 — ещё не готов, 410 — удалён по сроку хранения."""
+        job = self.get_object()
+        if job.status != ExportJob.STATUS_DONE:
+            return Response(
+                {"error": "Export is not ready", "status": job.status},
+                status=status.HTTP_409_CONFLICT,
+            )
+        if job.expires_at and job.expires_at <= timezone.now():
+            return Response({"error": "Export has expired"}, status=status.HTTP_410_GONE)
+        return FileResponse(
+            job.file.open("rb"),
+            as_attachment=True,
+            filename=export_download_name(job),
+            content_type=EXPORT_CONTENT_TYPES[job.export_format],
         )
 
 
@@ -527,12 +674,14 @@ class DashboardView(ListView):
     context_object_name = "albums"
 
     def get_queryset(self):
-        queryset = Album.objects.filter(user=self.request.user)
+        # Число фото и обложка (последнее фото, как album.photos.first) считаются
+        # в том же запросе, что и список альбомов
+        queryset = annotate_album_summary(Album.objects.filter(user=self.request.user))
 
         # Search
         query = self.request.GET.get("q")
         if query:
-            queryset = queryset.filter(Q(title__icontains=query) | Q(description__icontains=query))
+            queryset = search_albums(queryset, query)
 
         # Status Filter
         status_filter = self.request.GET.get("status")
@@ -541,10 +690,12 @@ class DashboardView(ListView):
         elif status_filter == "private":
             queryset = queryset.filter(is_public=False)
 
-        # Sorting
+        # Sorting: при поиске без явной сортировки — по релевантности
         ordering = self.request.GET.get("ordering", "-created_at")
         allowed_ordering = ["created_at", "-created_at", "title", "-title"]
-        if ordering in allowed_ordering:
+        if query and "ordering" not in self.request.GET:
+            queryset = queryset.order_by("-search_rank", "-created_at")
+        elif ordering in allowed_ordering:
             queryset = queryset.order_by(ordering)
         else:
             queryset = queryset.order_by("-created_at")
@@ -566,16 +717,15 @@ def create_album_view(request):
         description = request.POST.get("description")
         photos = request.FILES.getlist("photos")
 
-        # Check for file size
-        max_size = 10 * 1024 * 1024  # 10 MB
-        for photo in photos:
-            if photo.size > max_size:
-                return render(request, "pages/upload_error.html")
+        # Проверяем все файлы до создания альбома и обращений к хранилищу
+        errors = collect_upload_errors(photos)
+        if errors:
+            return render(request, "pages/upload_error.html", {"errors": errors})
 
         album = Album.objects.create(user=request.user, title=title, description=description)
 
-        for photo in photos:
-            Photo.objects.create(album=album, image=photo)
+        if photos:
+            ingest_photos(album, photos)
 
         return redirect("dashboard")
 
@@ -658,15 +808,15 @@ def add_photos_view(request, pk):
     if request.method == "POST":
         photos = request.FILES.getlist("photos")
         if photos:
-            # Check for file size
-            max_size = 10 * 1024 * 1024  # 10 MB
-            for photo in photos:
-                if photo.size > max_size:
-                    return render(request, "pages/upload_error.html")
-
-            for photo in photos:
-                Photo.objects.create(album=album, image=photo)
-            messages.success(request, f"Added {len(photos)} photos.")
+            errors = collect_upload_errors(photos)
+            if errors:
+                return render(request, "pages/upload_error.html", {"errors": errors})
+
+            results = ingest_photos(album, photos)
+            added = sum(1 for result in results if result.ok)
+            messages.success(request, f"Added {added} photos.")
+            if added < len(results):
+                messages.warning(request, f"Failed to upload {len(results) - added} photos.")
         else:
             messages.warning(request, "No photos selected.")
 
@@ -764,17 +914,14 @@ def generate_collage_view(request: HttpRequest, pk: uuid.UUID) -> HttpResponse:
     if not photos:
         return HttpResponse("No photos in album", status=404)
 
-    collage_file = create_collage_image(photos, output_format="PNG")
+    # Коллаж рендерится только если фото альбома изменились с прошлого раза
+    collage, _ = get_or_create_collage(album, photos, output_format="PNG")
 
-    if not collage_file:
+    if not collage:
         return HttpResponse("Error creating collage", status=500)
 
-    # Save collage to DB
-    filename = f"collage_{album.id}_{uuid.uuid4().hex[:8]}.png"
-    collage = Collage(album=album)
-    collage.image.save(filename, collage_file, save=True)
-
     # Re-open the saved file to return in response
+    filename = os.path.basename(collage.image.name)
     response = HttpResponse(collage.image.open(), content_type="image/png")
     response["Content-Disposition"] = f'attachment; filename="{filename}"'
     return response
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
 import sys
+import tempfile
 import os
 from pathlib import Path
 from dotenv import load_dotenv
@@ -179,19 +180,56 @@ IS_RAILWAY = os.getenv('RAILWAY_ENVIRONMENT_NAME') is not None
 # Force Cloudinary for usage as per user request
 USE_CLOUDINARY = True 
 
+# Удалённое хранилище медиафайлов: cloudinary или local — офлайн-замена Cloudinary
+# (albums.storage.LocalCloudinaryStorage) для разработки и бенчмарков без сети
+MEDIA_STORAGE = os.getenv('MEDIA_STORAGE', 'cloudinary')
+LOCAL_CLOUDINARY_ROOT = os.getenv('LOCAL_CLOUDINARY_ROOT', str(BASE_DIR / 'media' / 'cloudinary'))
+LOCAL_CLOUDINARY_URL = '/media/cloudinary/'
+# Имитация сети: задержка на каждый запрос (секунд) и скорость передачи (байт/с, 0 — без ограничения)
+LOCAL_CLOUDINARY_LATENCY = float(os.getenv('LOCAL_CLOUDINARY_LATENCY', '0.08'))
+LOCAL_CLOUDINARY_BANDWIDTH = int(os.getenv('LOCAL_CLOUDINARY_BANDWIDTH', str(5 * 1024 * 1024)))
+
+# Оригиналы, открытые на чтение, кэшируются на локальном диске (albums.storage.CachedStorage);
+# пустой MEDIA_CACHE_DIR отключает кэш
+MEDIA_CACHE_BACKEND = (
+    'albums.storage.LocalCloudinaryStorage'
+    if MEDIA_STORAGE == 'local'
+    else 'cloudinary_storage.storage.MediaCloudinaryStorage'
+)
+MEDIA_CACHE_DIR = os.getenv(
+    'MEDIA_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'photo_album_cache', 'media')
+)
+MEDIA_CACHE_MAX_BYTES = int(os.getenv('MEDIA_CACHE_MAX_BYTES', str(1024 * 1024 * 1024)))
+
 STORAGES = {
     "default": {
-        "BACKEND": "cloudinary_storage.storage.MediaCloudinaryStorage",
+        "BACKEND": "albums.storage.CachedStorage",
     },
     "staticfiles": {
         "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
     },
+    # Файлы отложенного экспорта (xlsx/csv/ndjson): в Cloudinary — как raw-ресурсы
+    "exports": {
+        "BACKEND": (
+            'albums.storage.LocalCloudinaryStorage'
+            if MEDIA_STORAGE == 'local'
+            else 'cloudinary_storage.storage.RawMediaCloudinaryStorage'
+        ),
+    },
 }
 
 if 'test' in sys.argv:
     STORAGES["default"] = {
         "BACKEND": "django.core.files.storage.FileSystemStorage",
     }
+    STORAGES["exports"] = STORAGES["default"]
+
+
+# Загруженные файлы хэшируются по мере получения (для дедупликации фото)
+FILE_UPLOAD_HANDLERS = [
+    'albums.uploadhandlers.HashingMemoryFileUploadHandler',
+    'albums.uploadhandlers.HashingTemporaryFileUploadHandler',
+]
 
 
 # Auth Redirects
@@ -214,3 +252,60 @@ cloudinary.config(
   secure = True
 )
 
+
+# Collage rendering
+# Количество потоков для параллельной загрузки фото в коллаж (1 = последовательно)
+COLLAGE_DECODE_WORKERS = int(os.getenv('COLLAGE_DECODE_WORKERS', '8'))
+# Максимальное время ожидания одной фотографии, секунд
+COLLAGE_DECODE_TIMEOUT = float(os.getenv('COLLAGE_DECODE_TIMEOUT', '30'))
+# Лимит пикселей исходного изображения (защита от decompression bomb)
+IMAGE_MAX_PIXELS = int(os.getenv('IMAGE_MAX_PIXELS', '50000000'))
+# Режим сборки коллажа: "canvas" (холст в памяти) или "strips" (по рядам через временный файл)
+COLLAGE_COMPOSE_MODE = os.getenv('COLLAGE_COMPOSE_MODE', 'canvas')
+# Дисковый кэш готовых ячеек коллажа (пустое значение отключает кэш)
+COLLAGE_TILE_CACHE_DIR = os.getenv(
+    'COLLAGE_TILE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'photo_album_cache', 'tiles')
+)
+COLLAGE_TILE_CACHE_MAX_BYTES = int(os.getenv('COLLAGE_TILE_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+
+# Background jobs (manage.py run_worker)
+# Пауза между опросами очереди задач, секунд
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '2'))
+# Через сколько секунд задача в статусе running считается брошенной и возвращается в очередь
+JOB_STALE_AFTER = int(os.getenv('JOB_STALE_AFTER', '900'))
+
+# Photo thumbnails
+# Формат миниатюр (WEBP или JPEG) и качество сжатия
+PHOTO_THUMBNAIL_FORMAT = os.getenv('PHOTO_THUMBNAIL_FORMAT', 'WEBP')
+PHOTO_THUMBNAIL_QUALITY = int(os.getenv('PHOTO_THUMBNAIL_QUALITY', '80'))
+
+# Photo uploads
+# Максимальный размер одного загружаемого файла, байт
+PHOTO_MAX_UPLOAD_SIZE = int(os.getenv('PHOTO_MAX_UPLOAD_SIZE', str(10 * 1024 * 1024)))
+# Количество потоков для параллельной отправки файлов в хранилище
+PHOTO_UPLOAD_WORKERS = int(os.getenv('PHOTO_UPLOAD_WORKERS', '4'))
+# Пережатие исходников при загрузке: длинная сторона в пикселях (0 — выключено),
+# формат (JPEG или WEBP) и качество. Владелец может включить хранение оригиналов в профиле
+PHOTO_INGEST_MAX_EDGE = int(os.getenv('PHOTO_INGEST_MAX_EDGE', '0'))
+PHOTO_INGEST_FORMAT = os.getenv('PHOTO_INGEST_FORMAT', 'JPEG')
+PHOTO_INGEST_QUALITY = int(os.getenv('PHOTO_INGEST_QUALITY', '85'))
+# Возобновляемая загрузка по частям: каталог для временных файлов,
+# максимальный размер одной части (байт) и время жизни сессии (секунд).
+# Каталог должен быть общим для web и воркера (run_worker удаляет старые файлы)
+UPLOAD_SESSION_DIR = os.getenv('UPLOAD_SESSION_DIR', os.path.join(BASE_DIR, 'var', 'uploads'))
+UPLOAD_CHUNK_MAX_SIZE = int(os.getenv('UPLOAD_CHUNK_MAX_SIZE', str(8 * 1024 * 1024)))
+UPLOAD_SESSION_TTL = int(os.getenv('UPLOAD_SESSION_TTL', str(24 * 60 * 60)))
+
+# Exports
+# Сколько секунд хранится файл отложенного экспорта (GET .../export-excel/?async=1);
+# одинаковый экспорт в течение этого времени отдаёт уже готовый файл
+EXPORT_JOB_TTL = int(os.getenv('EXPORT_JOB_TTL', str(60 * 60)))
+
+# Automatic bug reports (albums.middleware.AutomaticBugReportMiddleware)
+# Очередь отчётов в памяти процесса: при переполнении отчёты отбрасываются (и считаются),
+# фоновый поток пишет их в БД пачками не реже чем раз в BUG_REPORT_FLUSH_INTERVAL секунд
+BUG_REPORT_QUEUE_SIZE = int(os.getenv('BUG_REPORT_QUEUE_SIZE', '1000'))
+BUG_REPORT_BATCH_SIZE = int(os.getenv('BUG_REPORT_BATCH_SIZE', '100'))
+BUG_REPORT_FLUSH_INTERVAL = float(os.getenv('BUG_REPORT_FLUSH_INTERVAL', '1'))
+# В тестах фонового потока нет: отчёты записываются явным flush() в транзакции теста
+BUG_REPORT_BACKGROUND = 'test' not in sys.argv
@@ -15,6 +15,8 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.contrib.auth.views import LoginView, LogoutView
 from django.urls import path, include
@@ -101,3 +103,10 @@ urlpatterns = [
     path("api/auth/profile/", UserProfileView.as_view(), name="api_profile"),
     path("api/auth/change-password/", ChangePasswordView.as_view(), name="api_change_password"),
 ]
+
+if settings.MEDIA_STORAGE == "local":
+    # Офлайн-замена Cloudinary: в DEBUG отдаём файлы по URL, которые строит LocalCloudinaryStorage
+    urlpatterns += static(
+        settings.LOCAL_CLOUDINARY_URL + "image/upload/v1/",
+        document_root=settings.LOCAL_CLOUDINARY_ROOT,
+    )